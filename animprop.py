@@ -1,5 +1,5 @@
-from mu import Mu
-import sys
+from mu import Mu, MuObject
+from mubatch import batch_main
 from pprint import pprint
 
 def check_clip(clip, props, clips, path):
@@ -23,37 +23,44 @@ def check_clip(clip, props, clips, path):
                 if k.value != initValue or k.tangent[0] or k.tangent[1]:
                     properties[curve.property][0] = f"{count} animated"
 
-def check_obj(obj, props, anims, path, mu):
-    if path:
-        path = path + "/"
-    path = path + obj.transform.name
-    mu.objects[path] = obj
-    for o in obj.children:
-        check_obj(o, props, anims, path, mu)
-    if hasattr(obj, "animation"):
-        anims[path] = {}
-        for clip in obj.animation.clips:
-            check_clip(clip, props, anims[path], path)
-
 def find_props(fname, props, anims):
+    # stream the file: only the transforms (by path) and the animations are
+    # kept, the mesh data is never read
     mu = Mu()
     mu.objects = {}
-    if not mu.read(fname):
+    parents = []
+    path = ""
+    events = 0
+    for event, data in mu.stream(fname):
+        events += 1
+        if event == "transform":
+            path = "/".join(parents[-1:] + [data.name])
+            obj = MuObject()
+            obj.transform = data
+            mu.objects[path] = obj
+        elif event == "child_start":
+            parents.append(path)
+        elif event == "child_end":
+            path = parents.pop()
+        elif event == "component" and data[0] == "animation":
+            anims[path] = {}
+            for clip in data[1].load().clips:
+                check_clip(clip, props, anims[path], path)
+    if not events:
         print("could not read: " + fname)
         raise
-    check_obj(mu.obj, props, anims, "", mu)
     return mu
 
 def nice(tup):
     return "(" + ", ".join(map(lambda t:f"{t:6.3f}", tup)) + ")"
 
-for f in sys.argv[1:]:
+def animprop(f):
     props = set()
     anims = {}
     mu = find_props(f, props, anims)
     #pprint(mu.objects)
     if not props:
-        continue
+        return
     print(f)
     props = list(props)
     props.sort()
@@ -131,3 +138,6 @@ for f in sys.argv[1:]:
                         and i < len(propset["m_LocalRotation.w"][1])):
                         rot[3] = propset["m_LocalRotation.w"][1][i]
                     print(f"            {i:4d} {nice(loc)} {nice(rot)} {nice(scale)}")
+
+if __name__ == "__main__":
+    batch_main(animprop, description="list animated properties")
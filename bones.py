@@ -1,5 +1,5 @@
 from mu import Mu
-import sys
+from mubatch import batch_main
 
 def dump_skin(obj):
     smr = obj.skinned_mesh_renderer
@@ -22,10 +22,10 @@ def check_obj(obj):
 
 def find_skins(fname):
     mu = Mu()
-    if not mu.read(fname):
+    if not mu.read(fname, lazy=True):
         print("could not read: " + fname)
         raise
     check_obj(mu.obj)
 
-for f in sys.argv[1:]:
-    find_skins(f)
+if __name__ == "__main__":
+    batch_main(find_skins, description="dump skinned mesh renderers")
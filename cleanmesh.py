@@ -1,23 +1,46 @@
-from mu import Mu
-import sys
+from mu import Mu, MuRewrite
+from mubatch import batch_main
 
-def check_mesh(obj, level):
-    if hasattr(obj, "shared_mesh") and not hasattr(obj, "renderer"):
-        print(obj.transform.name)
-        obj.shared_mesh = None
-        return True
-    return False
+def find_meshes(fname):
+    # index (in file order) and name of the objects with a mesh but no
+    # renderer. None if the file could not be read.
+    objects = []
+    meshes = set()
+    renderers = set()
+    for event, data in Mu().stream(fname):
+        if event == "transform":
+            objects.append(data.name)
+        elif event == "component" and data[0] == "shared_mesh":
+            meshes.add(len(objects) - 1)
+        elif event == "component" and data[0] == "renderer":
+            renderers.add(len(objects) - 1)
+    if not objects:
+        return None
+    return [(i, objects[i]) for i in sorted(meshes - renderers)]
 
-def check_obj(obj, level = 0):
-    changed = check_mesh(obj, level)
-    for o in obj.children:
-       changed = check_obj(o, level + 1) or changed
-    return changed
+def clean_meshes(fname, meshes):
+    index = -1
+    def drop_mesh(event, data):
+        nonlocal index
+        if event == "transform":
+            index += 1
+        elif event == "component" and data[0] == "shared_mesh":
+            if index in meshes:
+                return MuRewrite.DROP
+        return MuRewrite.KEEP
+    # only the unused meshes are dropped, the rest of the file is copied as is
+    Mu().rewrite(fname, drop_mesh, fname+".out")
 
-for fname in sys.argv[1:]:
-    mu = Mu()
-    if not mu.read(fname):
+def clean_file(fname):
+    meshes = find_meshes(fname)
+    if meshes is None:
         print("could not read: " + fname)
-        break
-    if check_obj(mu.obj):
-        mu.write(fname+".out")
+        raise
+    for index, name in meshes:
+        print(name)
+    if meshes:
+        clean_meshes(fname, set(index for index, name in meshes))
+    return [name for index, name in meshes]
+
+if __name__ == "__main__":
+    batch_main(clean_file, description="remove meshes without renderers")
@@ -1,7 +1,10 @@
+from functools import partial
+from time import perf_counter
+import os
 import sys
 
 from mu import Mu, MuObject, MuTransform, MuMesh, MuTagLayer
-from multiprocessing import Pool
+from mubatch import collect, run_batch, summary
 
 def read_vertices(input):
     count = input.read_int()
@@ -62,12 +65,10 @@ def make_mesh(name, verts, faces):
     obj.shared_mesh = mesh
     return obj
 
-extra_points = set()
-
-def thread_func(parms):
-    name = parms
+def thread_func(extra_points, path):
+    name = os.path.splitext(path)[0]
     input = Mu()
-    input.file = open(name + ".bin", "rb");
+    input.file = open(path, "rb");
     verts = read_vertices(input)
     faces = read_facelist(input)
     final_faces = read_facelist(input)
@@ -77,7 +78,7 @@ def thread_func(parms):
     output = Mu()
     output.materials = []
     output.textures = []
-    output.obj = make_empty(name)
+    output.obj = make_empty(os.path.basename(name))
     output.obj.children.append(make_mesh("faces", verts, faces))
     output.obj.children.append(make_mesh("final_faces", verts, final_faces))
     output.obj.children.append(make_mesh("lit_faces", verts, lit_faces))
@@ -93,20 +94,20 @@ def thread_func(parms):
     output.write(name+".mu")
     print(name)
 
-for a in sys.argv[1:]:
-    extra_points.add(int(a))
-i = 0
-work_queue = []
-while True:
-    name = f"quickhull-{i:#05d}"
-    try:
-        file = open(name + ".bin", "rb");
-    except:
-        break
-    else:
-        file.close()
+if __name__ == "__main__":
+    extra_points = set()
+    for a in sys.argv[1:]:
+        extra_points.add(int(a))
+    i = 0
+    work_queue = []
+    while True:
+        name = f"quickhull-{i:#05d}.bin"
+        if not os.path.exists(name):
+            break
         work_queue.append(name)
-    i+=1
-print(len(work_queue))
-with Pool(12) as p:
-    p.map(thread_func, work_queue)
+        i+=1
+    print(len(work_queue))
+    start = perf_counter()
+    results = collect(run_batch(partial(thread_func, extra_points),
+                                work_queue))
+    print(summary(results, perf_counter() - start))
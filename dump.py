@@ -16,7 +16,7 @@
 #  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 #
 # ##### END GPL LICENSE BLOCK #####
-from mu import Mu
+from mu import Mu, MuLazyComponent
 import sys
 
 def dump_dict(thing, mu, level, dump_funcs):
@@ -44,9 +44,9 @@ def dump_thing(thing, mu, level, exclude, dump_funcs):
             else:
                 print(("%s%s = " % ("    " * level, a)) + str(attr))
 
-def dump_textures(mu):
+def dump_textures(mu, textures):
     print("Textures")
-    for i, tex in enumerate(mu.textures):
+    for i, tex in enumerate(textures):
         print (i, tex.name, tex.type)
 
 def dump_mattex(name, mu, mt, level):
@@ -57,9 +57,9 @@ mat_dump_funcs = {
     'MuMatTex': dump_mattex
 }
 
-def dump_materials(mu):
+def dump_materials(mu, materials):
     print("Materials")
-    for i, mat in enumerate(mu.materials):
+    for i, mat in enumerate(materials):
         print(i, mat.name)
         dump_thing(mat, mu, 1, [], mat_dump_funcs);
 
@@ -77,7 +77,8 @@ mesh_dump_funcs = {
 }
 
 def dump_mesh(name, mu, mesh, level):
-    print("%s Mesh: %s = %s" % ("    " * level, name, str(mesh)))
+    # the mesh data is not loaded
+    print("%s Mesh: %s" % ("    " * level, name))
     #dump_thing(mesh, mu, level, [], mesh_dump_funcs)
 
 sharedmesh_dump_funcs = {
@@ -86,7 +87,8 @@ sharedmesh_dump_funcs = {
 }
 
 def dump_skinnedmeshrenderer(name, mu, mesh, level):
-    print("%s SkinnedMeshRenderer: %s = %s" % ("    " * level, name, str(mesh)))
+    # the mesh data is not loaded
+    print("%s SkinnedMeshRenderer: %s" % ("    " * level, name))
     #dump_thing(mesh, mu, level + 1, [], sharedmesh_dump_funcs)
 
 def dump_light(name, mu, mesh, level):
@@ -132,43 +134,61 @@ def dump_animation(name, mu, ani, level):
     for i, clip in enumerate(ani.clips):
         dump_clip(clip.name, mu, clip, level + 1)
 
-object_dump_funcs={
-    "MuRenderer": dump_renderer,
-    "MuMesh": dump_mesh,
-    "MuSkinnedMeshRenderer": dump_skinnedmeshrenderer,
-    "MuLight": dump_light,
-    "MuColliderMesh": dump_collider,
-    "MuColliderSphere": dump_collider,
-    "MuColliderCapsule": dump_collider,
-    "MuColliderBox": dump_collider,
-    "MuColliderWheel": dump_collider,
-    "MuAnimation": dump_animation,
+# keyed by MuObject attribute
+component_dump_funcs = {
+    "renderer": dump_renderer,
+    "shared_mesh": dump_mesh,
+    "skinned_mesh_renderer": dump_skinnedmeshrenderer,
+    "light": dump_light,
+    "collider": dump_collider,
+    "animation": dump_animation,
 }
 
-def dump_object(mu, obj, level=0):
-    trans = obj.transform
+# components whose dump needs only the name: these are not loaded
+unloaded_components = {"shared_mesh", "skinned_mesh_renderer"}
+
+def dump_transform(trans, level):
     print("%s%s" % ("    " * level, trans.name))
     print("%s  lp %s" % ("    " * level, str(trans.localPosition)))
     print("%s  lr %s" % ("    " * level, str(trans.localRotation)))
     print("%s  ls %s" % ("    " * level, str(trans.localScale)))
-    if hasattr(obj, "tag_and_layer"):
-        tl = obj.tag_and_layer
-        print("%s  %s %d" % ("    " * level, tl.tag, tl.layer))
-    dump_thing(obj, mu, level, ["transform", "tag_and_layer", "children"],
-                object_dump_funcs)
 
-    for child in obj.children:
-        dump_object(mu, child, level + 1)
+def dump_component(mu, name, component, level):
+    if name == "tag_and_layer":
+        print("%s  %s %d" % ("    " * level, component.tag, component.layer))
+        return
+    if (isinstance(component, MuLazyComponent)
+        and name not in unloaded_components):
+        component = component.load()
+    if name in component_dump_funcs:
+        component_dump_funcs[name](name, mu, component, level)
+    else:
+        print(("%s%s = " % ("    " * level, name)) + str(component))
 
 def dump(fname):
+    # stream the file so even huge models are dumped in constant memory
     mu = Mu()
-    if not mu.read(fname):
+    level = 0
+    events = 0
+    for event, data in mu.stream(fname):
+        if not events:
+            print(mu.version)
+        events += 1
+        if event == "transform":
+            dump_transform(data, level)
+        elif event == "component":
+            dump_component(mu, data[0], data[1], level)
+        elif event == "child_start":
+            level += 1
+        elif event == "child_end":
+            level -= 1
+        elif event == "textures":
+            dump_textures(mu, data)
+        elif event == "materials":
+            dump_materials(mu, data)
+    if not events:
         print("could not read: " + fname)
         raise
-    print(mu.version)
-    dump_textures(mu)
-    dump_materials(mu)
-    dump_object(mu, mu.obj)
 
 for f in sys.argv[1:]:
     print(f)
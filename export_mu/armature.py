@@ -26,7 +26,7 @@ from ..mu import MuObject, MuTransform, MuTagLayer
 from ..utils import strip_nnn, collect_armature_modifiers
 
 from .export import make_obj_core, exported_objects
-from .mesh import create_skinned_mesh
+from .mesh import create_skinned_meshes, add_mesh_parts
 
 def bone_transform(bone, obj):
     matrix = bone.matrix_local
@@ -99,7 +99,7 @@ def handle_armature(obj, muobj, mu):
     if len(bindpose_children) > 1:
         mu.messages.append(({'WARNING'}, "too many bind-pose armatures, ignoring excess"))
         bindpose_children = bindpose_children[:1]
-    bindposes = map(lambda o: o.data, bindpose_children)
+    bindposes = [o.data for o in bindpose_children]
     path = mu.path
     if deform_children:
         child = deform_children[0]
@@ -109,11 +109,14 @@ def handle_armature(obj, muobj, mu):
             mods[i] = (m, m.show_viewport, m.show_render)
             m.show_viewport = False
             m.show_render = False
-        smr = create_skinned_mesh(deform_children[0], mu, armature, bindposes)
+        smrs = create_skinned_meshes(deform_children[0], mu, armature,
+                                     bindposes)
         for m in mods:
             m[0].show_viewport = m[1]
             m[0].show_render = m[2]
-        muobj.skinned_mesh_renderer = smr
+        muobj.skinned_mesh_renderer = smrs[0]
+        add_mesh_parts(muobj, [{"skinned_mesh_renderer": smr}
+                               for smr in smrs[1:]])
     muobj.bone_paths = {}
     muobj.animated_bones = set()
     muobj.path = path
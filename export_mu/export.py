@@ -147,7 +147,8 @@ special_modelTypes = {
     'VOLUME': {},
 }
 
-def export_object(obj, filepath):
+def export_object(obj, filepath, weld_tolerance=0.0,
+                  optimize_vertex_cache=False, separate_materials=False):
     exported_objects.clear()
     animations = collect_animations(obj)
     anim_root = find_path_root(animations)
@@ -160,6 +161,9 @@ def export_object(obj, filepath):
     mu.props = []
     mu.volumes = {}
     mu.messages = []
+    mu.weld_tolerance = weld_tolerance
+    mu.optimize_vertex_cache = optimize_vertex_cache
+    mu.separate_materials = separate_materials
     mu.internals = []
     mu.type = obj.muproperties.modelType
     mu.CoMOffset = None
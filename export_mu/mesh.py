@@ -20,14 +20,17 @@
 # <pep8 compliant>
 
 import bpy
-from mathutils import Vector, Matrix
+import numpy
+from mathutils import Vector, Matrix, Quaternion
 
 from ..mu import MuMesh, MuRenderer, MuSkinnedMeshRenderer, MuBoneWeight
+from ..mu import MuObject, MuTransform
 from ..utils import collect_modifiers
 
 from .material import make_material
 
 from .export_util import is_collider
+from .vertexcache import optimize_tris, first_use_order, acmr
 
 from pprint import pprint
 
@@ -39,21 +42,30 @@ Matrix_YZ = Matrix(((1,0,0,0),
 
 MU_MAX_VERTS = 65534
 
-def build_submeshes(mesh):
-    submeshes = []
-    submesh = []
-    for i in range(len(mesh.loop_triangles)):
-        submesh.append(i)
-    submeshes.append(submesh)
-    return submeshes
+def build_submeshes(mesh, slots=()):
+    # the triangles of each material slot in slots, in the same order.
+    # Triangles using any other slot (empty, or without a Mu shader) go in
+    # the first submesh
+    num_tris = len(mesh.loop_triangles)
+    if len(slots) < 2:
+        return [numpy.arange(num_tris)]
+    mat_index = numpy.empty(num_tris, dtype=numpy.int32)
+    mesh.loop_triangles.foreach_get("material_index", mat_index)
+    lookup = numpy.zeros(max(max(slots), mat_index.max(initial=0)) + 1,
+                         dtype=numpy.int64)
+    lookup[slots] = numpy.arange(len(slots))
+    submesh_index = lookup[mat_index]
+    # stable, so each submesh keeps the triangles in mesh order
+    order = numpy.argsort(submesh_index, kind="stable")
+    counts = numpy.bincount(submesh_index, minlength=len(slots))
+    return numpy.split(order, numpy.cumsum(counts)[:-1])
 
 def make_tris(mesh, submeshes, vertex_map):
-    for sm in submeshes:
-        i = 0
-        while i < len(sm):
-            tri = mesh.loop_triangles[sm[i]].loops
-            sm[i] = vertex_map[tri[0]], vertex_map[tri[1]], vertex_map[tri[2]]
-            i += 1
+    tri_loops = numpy.empty(len(mesh.loop_triangles) * 3, dtype=numpy.int32)
+    mesh.loop_triangles.foreach_get("loops", tri_loops)
+    tris = vertex_map[tri_loops].reshape(-1, 3)
+    for i, sm in enumerate(submeshes):
+        submeshes[i] = tris[sm]
     return submeshes
 
 def get_mesh(obj):
@@ -67,62 +79,105 @@ def get_mesh(obj):
         mod.show_viewport = True
     return mesh
 
+class LoopData:
+    # the mesh's per-loop data as numpy arrays, one row per loop: the loop's
+    # vertex index and its attributes. Attributes that aren't exported (all
+    # but verts for colliders, uvs without uv layers, ...) are None.
+    # tangents holds the loop tangent with the bitangent sign as w.
+    attributes = ["normals", "uvs", "uv2s", "tangents", "colors"]
+    def __init__(self, count):
+        self.count = count
+        self.verts = numpy.zeros(count, dtype=numpy.int32)
+        self.normals = None
+        self.uvs = None
+        self.uv2s = None
+        self.tangents = None
+        self.colors = None
+
+def loop_attribute(collection, attr, count, width=1):
+    data = numpy.empty(count * width, dtype=numpy.float32)
+    collection.foreach_get(attr, data)
+    if width > 1:
+        data = data.reshape(count, width)
+    return data
+
 def get_vertex_data(mu, mesh, obj):
     full_data = not is_collider(obj)
-    vertdata = [None] * len(mesh.loops)
-    if not vertdata:
-        return vertdata
+    num_loops = len(mesh.loops)
+    vertex_data = LoopData(num_loops)
+    if not num_loops:
+        return vertex_data
+    mesh.loops.foreach_get("vertex_index", vertex_data.verts)
+    if not full_data:
+        return vertex_data
     if mesh.loops[0].normal == Vector():
         mesh.calc_normals()
-    tangentsOk = True
-    if full_data and mesh.uv_layers:
+    vertex_data.normals = loop_attribute(mesh.loops, "normal", num_loops, 3)
+    if mesh.uv_layers:
         uv_layers = mesh.uv_layers
         #FIXME active UV layer?
-        uvs = list(map(lambda a: Vector(a.uv).freeze(), uv_layers[0].data))
+        vertex_data.uvs = loop_attribute(uv_layers[0].data, "uv",
+                                         num_loops, 2)
         if len(uv_layers) > 1:
-            uv2s = list(map(lambda a: Vector(a.uv).freeze(), uv_layers[1].data))
-        else:
-            uv2s = [None] * len(mesh.loops)
+            vertex_data.uv2s = loop_attribute(uv_layers[1].data, "uv",
+                                              num_loops, 2)
         try:
             mesh.calc_tangents(uvmap = mesh.uv_layers[0].name)
         except RuntimeError:
-            tangentsOk = False
             mu.messages.append(({'WARNING'}, "tangents not exported due to N-gons in the mesh: " + obj.name))
-    else:
-        uvs = [None] * len(mesh.loops)
-        uv2s = [None] * len(mesh.loops)
-    if full_data and mesh.vertex_colors:
-        #FIXME active colors?
-        colors = list(map(lambda a: Vector(a.color).freeze(), mesh.vertex_colors[0].data))
-    else:
-        colors = [None] * len(mesh.loops)
-    for i in range(len(mesh.loops)):
-        v = mesh.loops[i].vertex_index
-        if full_data:
-            n = Vector(mesh.loops[i].normal).freeze()
         else:
-            n = None
-        uv = uvs[i]
-        uv2 = uv2s[i]
-        col = colors[i]
-        if uv != None and tangentsOk:
-            t = Vector(mesh.loops[i].tangent).freeze()
-            bts = mesh.loops[i].bitangent_sign
+            tangents = numpy.empty((num_loops, 4), dtype=numpy.float32)
+            tangents[:, :3] = loop_attribute(mesh.loops, "tangent",
+                                             num_loops, 3)
+            tangents[:, 3] = loop_attribute(mesh.loops, "bitangent_sign",
+                                            num_loops)
+            vertex_data.tangents = tangents
+    if mesh.vertex_colors:
+        #FIXME active colors?
+        vertex_data.colors = loop_attribute(mesh.vertex_colors[0].data,
+                                            "color", num_loops, 4)
+    return vertex_data
+
+def loop_keys(vertex_data, tolerance):
+    # one row per loop: the vertex index and the loop's attributes, snapped
+    # to a grid of size tolerance (or as their exact bits when tolerance is
+    # 0). Values either side of a grid line never match, however close.
+    columns = [vertex_data.verts.astype(numpy.int64)[:, None]]
+    for name in LoopData.attributes:
+        data = getattr(vertex_data, name)
+        if data is None:
+            continue
+        if tolerance > 0:
+            data = numpy.floor(data / tolerance + 0.5).astype(numpy.int64)
         else:
-            t = None
-            bts = None
-        vertdata[i] = (v, n, uv, uv2, t, bts, col)
-    return vertdata
-
-def make_vertex_map(vertex_data):
-    vdict = {}
-    vmap = []
-    for i, v in enumerate(vertex_data):
-        #print(i, v in vdict)
-        if v not in vdict:
-            vdict[v] = len(vdict)
-        vmap.append(vdict[v])
-    return vmap, len(vdict)
+            # + 0.0 turns -0.0 into 0.0 so the two are welded
+            data = (data + 0.0).view(numpy.int32).astype(numpy.int64)
+        columns.append(data)
+    keys = numpy.ascontiguousarray(numpy.hstack(columns))
+    # each row as a single opaque value so rows can be compared as a whole
+    row = numpy.dtype((numpy.void, keys.dtype.itemsize * keys.shape[1]))
+    return keys.view(row).ravel()
+
+def make_vertex_map(vertex_data, tolerance=0.0):
+    """Weld the loops into vertices.
+
+    Loops of the same mesh vertex whose attributes are all equal become one
+    vertex. With a tolerance, the attributes are first snapped to a grid of
+    that size, so loops whose attributes land in the same grid cells match.
+    Returns the vertex index of each loop and the first loop of each vertex,
+    from which the vertex takes its attributes. Vertices are numbered in order of first use.
+    """
+    if not vertex_data.count:
+        empty = numpy.zeros(0, dtype=numpy.int64)
+        return empty, empty
+    keys = loop_keys(vertex_data, tolerance)
+    first, inverse = numpy.unique(keys, return_index=True,
+                                  return_inverse=True)[1:]
+    # numpy.unique sorts the keys: renumber by first use
+    order = numpy.argsort(first)
+    rank = numpy.empty(len(order), dtype=numpy.int64)
+    rank[order] = numpy.arange(len(order))
+    return rank[inverse.ravel()], first[order]
 
 def get_key_normals(shape_key):
     normals = shape_key.normals_split_get()
@@ -134,7 +189,7 @@ def get_key_verts(shape_key):
     verts = list(map(lambda data: data.co, shape_key.data))
     return verts
 
-def process_shape_keys(mesh, mumesh, vertex_map, vertex_data):
+def process_shape_keys(mesh, mumesh, loops, vertex_data):
     num_shapes = len(mesh.shape_keys.key_blocks)
     num_verts = len(mumesh.verts)
     new_verts = (num_shapes - 1) * num_verts
@@ -157,11 +212,13 @@ def process_shape_keys(mesh, mumesh, vertex_map, vertex_data):
     basis = mesh.shape_keys.reference_key
     basis_verts = get_key_verts(basis)
     basis_normals = get_key_normals(basis)
+    # each exported vertex's mesh vertex and loop
+    loop_verts = vertex_data.verts[loops].tolist()
+    loops = loops.tolist()
     #ensure base mesh data reflects the basis key
-    for i, vind in enumerate(vertex_map):
-        v = vertex_data[i][0]
+    for vind, v in enumerate(loop_verts):
         mumesh.verts[vind] = basis_verts[v]
-        mumesh.normals[vind] = basis_normals[i]
+        mumesh.normals[vind] = basis_normals[loops[vind]]
     base_ind = num_verts
     for key in mesh.shape_keys.key_blocks:
         if key.name == basis.name:
@@ -171,8 +228,8 @@ def process_shape_keys(mesh, mumesh, vertex_map, vertex_data):
         ref_normals = get_key_normals(key.relative_key)
         verts = get_key_verts(key)
         normals = get_key_normals(key)
-        for i, vind in enumerate(vertex_map):
-            v = vertex_data[i][0]
+        for vind, v in enumerate(loop_verts):
+            i = loops[vind]
             vert = verts[v] - ref_verts[v]
             norm = normals[i] - ref_normals[i]
             mumesh.verts[base_ind + vind] = vert
@@ -180,70 +237,173 @@ def process_shape_keys(mesh, mumesh, vertex_map, vertex_data):
         base_ind += num_verts
 
 
-def make_mumesh(mesh, submeshes, vertex_data, vertex_map, num_verts):
-    verts = [None] * num_verts
-    groups = [None] * num_verts
-    uvs = [None] * num_verts
-    uv2s = [None] * num_verts
-    normals = [None] * num_verts
-    tangents = [None] * num_verts
-    bitangents = [None] * num_verts
-    colors = [None] * num_verts
-    for i, vind in enumerate(vertex_map):
-        v, n, uv, uv2, t, bts, col = vertex_data[i]
-        verts[vind] = v
-        normals[vind] = n
-        uvs[vind] = uv
-        uv2s[vind] = uv2
-        tangents[vind] = t
-        bitangents[vind] = bts
-        colors[vind] = col
-    for i, v in enumerate(verts):
-        verts[i] = mesh.vertices[v].co
-        groups[i] = mesh.vertices[v].groups
-    if tangents[0] != None:
-        for i, t in enumerate(tangents):
-            tangents[i] = tuple(t) + (bitangents[i],)
+def optimize_vertex_cache(mu, obj, submeshes, loops):
+    # reorder the triangles for the vertex cache, then number the vertices
+    # in the order the triangles use them
+    submeshes = [sm.tolist() for sm in submeshes]
+    before = acmr(submeshes)
+    num_verts = len(loops)
+    submeshes = [optimize_tris(sm, num_verts) for sm in submeshes]
+    order = numpy.array(first_use_order(submeshes, num_verts),
+                        dtype=numpy.int64)
+    remap = numpy.empty(num_verts, dtype=numpy.int64)
+    remap[order] = numpy.arange(num_verts)
+    submeshes = [remap[numpy.array(sm, dtype=numpy.int64).reshape(-1, 3)]
+                 for sm in submeshes]
+    after = acmr([sm.tolist() for sm in submeshes])
+    mu.messages.append(({'INFO'}, f"{obj.name}: vertex cache ACMR "
+                        f"{before:.3f} -> {after:.3f}"))
+    return submeshes, loops[order]
+
+def split_tris(tris, positions, max_verts):
+    # recursively halve the triangles (by their centers, across the longest
+    # side of their bounds) until each part uses at most max_verts vertices.
+    # Returns the indices of each part's triangles, neighbouring parts
+    # being next to each other in space as well as in the list
+    parts = []
+    stack = [numpy.arange(len(tris))]
+    while stack:
+        part = stack.pop()
+        if len(numpy.unique(tris[part])) <= max_verts:
+            parts.append(numpy.sort(part))
+            continue
+        centers = positions[tris[part]].mean(axis=1)
+        axis = numpy.argmax(centers.max(axis=0) - centers.min(axis=0))
+        half = len(part) // 2
+        split = numpy.argpartition(centers[:, axis], half)
+        stack.append(part[split[half:]])
+        stack.append(part[split[:half]])
+    return parts
+
+def compact_part(submeshes, loops):
+    # keep only the vertices the triangles use, renumbered in their
+    # original order
+    tris = numpy.concatenate(submeshes)
+    used, local = numpy.unique(tris, return_inverse=True)
+    local = local.reshape(-1, 3)
+    bounds = numpy.cumsum([len(sm) for sm in submeshes])[:-1]
+    return numpy.split(local, bounds), loops[used]
+
+def split_mesh(mesh, submeshes, vertex_data, loops, max_verts):
+    """Split the mesh into parts of at most max_verts vertices.
+
+    Returns a list of (submeshes, loops) pairs, one per part, with the
+    triangles renumbered for the part's own vertices. Vertices on the
+    boundary between parts are in each of them. A mesh within the limit
+    is returned as is.
+    """
+    if len(loops) <= max_verts:
+        return [(submeshes, loops)]
+    tris = numpy.concatenate(submeshes)
+    # which submesh each triangle belongs to
+    sm_index = numpy.repeat(numpy.arange(len(submeshes)),
+                            [len(sm) for sm in submeshes])
+    co = loop_attribute(mesh.vertices, "co", len(mesh.vertices), 3)
+    positions = co[vertex_data.verts[loops]]
+    parts = []
+    for part in split_tris(tris, positions, max_verts):
+        part_tris = tris[part]
+        part_sm = sm_index[part]
+        parts.append(compact_part([part_tris[part_sm == i]
+                                   for i in range(len(submeshes))], loops))
+    return parts
+
+def make_mumesh(mesh, submeshes, vertex_data, loops):
+    vert_index = vertex_data.verts[loops]
+    co = loop_attribute(mesh.vertices, "co", len(mesh.vertices), 3)
     mumesh = MuMesh()
-    mumesh.submeshes = submeshes
-    mumesh.verts = verts
-    mumesh.groups = groups
-    if normals[0] != None:
-        mumesh.normals = normals
-    if uvs[0] != None:
-        mumesh.uvs = uvs
-    if uv2s[0] != None:
-        mumesh.uv2s = uv2s
-    if tangents[0] != None:
-        mumesh.tangents = tangents
-    if colors[0] != None:
-        mumesh.colors = colors
+    mumesh.submeshes = [sm.tolist() for sm in submeshes]
+    mumesh.verts = co[vert_index].tolist()
+    mumesh.groups = [mesh.vertices[v].groups for v in vert_index.tolist()]
+    for name in LoopData.attributes:
+        data = getattr(vertex_data, name)
+        if data is not None:
+            setattr(mumesh, name, data[loops].tolist())
     return mumesh
 
-def make_mesh(mu, obj):
+def make_meshes(mu, obj, max_verts=None, slots=(), separate=False):
+    """Export the object's mesh as one MuMesh per part.
+
+    Each material slot in slots gets a submesh, or with separate, a part
+    of its own. With max_verts, a mesh with more vertices (counting those
+    added for shape keys) is split into parts that fit. Returns a list of
+    (MuMesh, indices) pairs, where indices gives the slots (as indices into
+    slots) of the MuMesh's submeshes.
+    """
     mesh = get_mesh(obj)
     #mesh is always a copy of the object mesh data, but this is non-destructive
     #anyway
     if not mesh.loop_triangles:
         mesh.calc_loop_triangles()
     vertex_data = get_vertex_data(mu, mesh, obj)
-    vertex_map, num_verts = make_vertex_map(vertex_data)
-    submeshes = build_submeshes(mesh)
+    vertex_map, loops = make_vertex_map(vertex_data, mu.weld_tolerance)
+    submeshes = build_submeshes(mesh, slots)
     submeshes = make_tris(mesh, submeshes, vertex_map)
-    #pprint(submeshes)
-    mumesh = make_mumesh(mesh, submeshes, vertex_data, vertex_map, num_verts)
-    mesh = obj.data
-    if not is_collider(obj) and mesh.shape_keys:
-        process_shape_keys(mesh, mumesh, vertex_map, vertex_data)
+    shape_keys = None
+    if not is_collider(obj) and obj.data.shape_keys:
+        shape_keys = obj.data.shape_keys
+    groups = []
+    if separate and len(submeshes) > 1:
+        groups = [(compact_part([sm], loops), [i])
+                  for i, sm in enumerate(submeshes) if len(sm)]
+    if not groups:
+        groups = [((submeshes, loops), list(range(len(slots))))]
+    mumeshes = []
+    for (submeshes, loops), indices in groups:
+        parts = [(submeshes, loops)]
+        if max_verts:
+            # every shape key adds a copy of the vertices
+            num_shapes = len(shape_keys.key_blocks) if shape_keys else 1
+            part_verts = max(max_verts // num_shapes, 3)
+            parts = split_mesh(mesh, submeshes, vertex_data, loops,
+                               part_verts)
+            if len(parts) > 1:
+                limit = f"{part_verts} vertices"
+                if num_shapes > 1:
+                    limit += (f" ({max_verts} divided among {num_shapes}"
+                              f" shape keys, each a copy of the vertices)")
+                mu.messages.append(({'INFO'}, f"{obj.name}: split into "
+                                    f"{len(parts)} meshes of at most "
+                                    f"{limit}"))
+        for submeshes, loops in parts:
+            if mu.optimize_vertex_cache and not is_collider(obj):
+                submeshes, loops = optimize_vertex_cache(mu, obj, submeshes,
+                                                         loops)
+            #pprint(submeshes)
+            mumesh = make_mumesh(mesh, submeshes, vertex_data, loops)
+            if shape_keys:
+                process_shape_keys(obj.data, mumesh, loops, vertex_data)
+            mumeshes.append((mumesh, indices))
+    return mumeshes
+
+def make_mesh(mu, obj):
+    mumesh = make_meshes(mu, obj)[0][0]
     if len(mumesh.verts) > MU_MAX_VERTS:
         mu.messages.append(({'WARNING'}, f"Mesh has more than {MU_MAX_VERTS} "
                             "vertices: KSP will not import it properly "
                             + obj.name))
     return mumesh
 
-def mesh_materials(mu, mesh):
+def add_mesh_parts(muobj, components):
+    # the extra parts of a split mesh go in children of the object, with no
+    # transform of their own
+    for i, component in enumerate(components):
+        child = MuObject()
+        child.transform = MuTransform()
+        child.transform.name = f"{muobj.transform.name}.part{i + 1}"
+        child.transform.localPosition = Vector((0, 0, 0))
+        child.transform.localRotation = Quaternion((1, 0, 0, 0))
+        child.transform.localScale = Vector((1, 1, 1))
+        child.tag_and_layer = muobj.tag_and_layer
+        for name, value in component.items():
+            setattr(child, name, value)
+        muobj.children.append(child)
+
+def material_slots(mu, mesh):
+    # the material slots that export a material, and their materials
+    slots = []
     materials = []
-    for mat in mesh.materials:
+    for i, mat in enumerate(mesh.materials):
         if not mat:
             mu.messages.append(({'WARNING'}, f"{mesh.name} has empty material "
                                 "slot"))
@@ -251,13 +411,14 @@ def mesh_materials(mu, mesh):
         if mat.mumatprop.shaderName:
             if mat.name not in mu.materials:
                 mu.materials[mat.name] = make_material(mu, mat)
+            slots.append(i)
             materials.append(mu.materials[mat.name].index)
-    return materials
+    return slots, materials
 
-def make_renderer(mu, obj, mesh):
+def make_renderer(mu, obj, materials):
     rend = MuRenderer()
     #FIXME shadows
-    rend.materials = mesh_materials(mu, mesh)
+    rend.materials = materials
     rend.castShadows = obj.muproperties.castShadows
     rend.receiveShadows = obj.muproperties.receiveShadows
     if not rend.materials:
@@ -313,16 +474,30 @@ def make_bindPoses(smr, armature, bindPoses):
         smr.mesh.bindPoses[i] = mat
 
 def handle_mesh(obj, muobj, mu):
-    muobj.shared_mesh = make_mesh(mu, obj)
-    muobj.renderer = make_renderer(mu, obj, obj.data)
+    slots, materials = material_slots(mu, obj.data)
+    parts = []
+    for mumesh, indices in make_meshes(mu, obj, MU_MAX_VERTS, slots,
+                                       mu.separate_materials):
+        renderer = make_renderer(mu, obj, [materials[i] for i in indices])
+        parts.append({"shared_mesh": mumesh, "renderer": renderer})
+    muobj.shared_mesh = parts[0]["shared_mesh"]
+    muobj.renderer = parts[0]["renderer"]
+    add_mesh_parts(muobj, parts[1:])
     return muobj
 
-def create_skinned_mesh(obj, mu, armature, bindPoses):
+def create_skinned_meshes(obj, mu, armature, bindPoses):
+    slots, materials = material_slots(mu, obj.data)
+    return [create_skinned_mesh(obj, mu, armature, bindPoses, mumesh,
+                                [materials[i] for i in indices])
+            for mumesh, indices in make_meshes(mu, obj, MU_MAX_VERTS, slots,
+                                               mu.separate_materials)]
+
+def create_skinned_mesh(obj, mu, armature, bindPoses, mumesh, materials):
     smr = MuSkinnedMeshRenderer()
-    smr.mesh = make_mesh(mu, obj)
+    smr.mesh = mumesh
     smr.bones, smr.quality = mesh_bones(obj, smr.mesh, armature)
     make_bindPoses (smr, armature, bindPoses)
-    smr.materials = mesh_materials(mu, obj.data)
+    smr.materials = materials
     #FIXME center, size, updateWhenOffscreen
     #however, with updateWhenOffscreen = 1, Unity will recaculate the mesh
     #bounds every frame, so take the easy way for now
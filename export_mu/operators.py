@@ -21,17 +21,20 @@
 
 import bpy
 from bpy_extras.io_utils import ExportHelper
-from bpy.props import StringProperty
+from bpy.props import BoolProperty, FloatProperty, StringProperty
 
 from ..utils import strip_nnn, collect_hierarchy_objects
 
 from . import export
 from . import volume
 
-def export_mu(operator, context, filepath):
+def export_mu(operator, context, filepath, weld_tolerance=0.0,
+              optimize_vertex_cache=False, separate_materials=False):
     collections = export.enable_collections()
     try:
-        mu = export.export_object (context.active_object, filepath)
+        mu = export.export_object (context.active_object, filepath,
+                                   weld_tolerance, optimize_vertex_cache,
+                                   separate_materials)
     finally:
         export.restore_collections(collections)
     for m in mu.messages:
@@ -44,7 +47,26 @@ exportable_objects = {
     bpy.types.Armature,
 }
 
-class KSPMU_OT_ExportMu(bpy.types.Operator, ExportHelper):
+# the export options, shared by the export operators
+class ExportMuOptions:
+    weld_tolerance: FloatProperty(name="Weld Tolerance",
+            description="Snap the normals, uvs, tangents and colors of a"
+                        " vertex's loops to a grid of this size before"
+                        " matching them: loops that land in the same grid"
+                        " cells are exported as one vertex (0 for exact"
+                        " matches only)",
+            default=0.0, min=0.0, precision=6)
+    optimize_vertex_cache: BoolProperty(name="Optimize Vertex Cache",
+            description="Reorder triangles and vertices for the GPU's vertex"
+                        " cache (reports the cache miss ratio before and"
+                        " after)", default=False)
+    separate_materials: BoolProperty(name="Separate Materials",
+            description="Export each material of a mesh as a child object"
+                        " instead of as a submesh (KSP draws only the first"
+                        " submesh)", default=False)
+
+class KSPMU_OT_ExportMu(bpy.types.Operator, ExportHelper,
+                        ExportMuOptions):
     '''Save a KSP Mu (.mu) File'''
     bl_idname = "export_object.ksp_mu"
     bl_label = "Export Mu"
@@ -62,7 +84,8 @@ class KSPMU_OT_ExportMu(bpy.types.Operator, ExportHelper):
                                              "axis_forward", "axis_up"))
         return export_mu(self, context, **keywords)
 
-class KSPMU_OT_ExportMu_quick(bpy.types.Operator, ExportHelper):
+class KSPMU_OT_ExportMu_quick(bpy.types.Operator, ExportHelper,
+                              ExportMuOptions):
     '''Save a KSP Mu (.mu) File, defaulting name to selected object'''
     bl_idname = "export_object.ksp_mu_quick"
     bl_label = "Export Mu (quick)"
@@ -0,0 +1,152 @@
+# vim:ts=4:et
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Triangle ordering for the GPU's post-transform vertex cache, after Tom
+# Forsyth's "Linear-Speed Vertex Cache Optimisation". Triangles are emitted
+# greedily: the next triangle is the one whose vertices score best, where a
+# vertex scores for being recently used (in a simulated LRU cache) and for
+# having few triangles left (so no vertex is left stranded). Only the
+# triangles touching the cache are rescored after each step.
+#
+# ACMR (average cache miss ratio: vertices transformed per triangle, 0.5 at
+# best for large grids, 3 at worst) is measured with a FIFO cache, as most
+# hardware uses.
+
+from collections import deque
+
+cache_size = 32
+
+# Forsyth's tuning
+cache_decay_power = 1.5
+last_tri_score = 0.75
+valence_boost_scale = 2.0
+valence_boost_power = 0.5
+
+cache_scores = [last_tri_score] * 3
+for i in range(3, cache_size):
+    scale = 1.0 - (i - 3) / (cache_size - 3)
+    cache_scores.append(scale ** cache_decay_power)
+
+def vertex_score(cache_pos, remaining):
+    if not remaining:
+        # no triangles left: the vertex doesn't matter any more
+        return -1.0
+    score = 0.0
+    if cache_pos >= 0:
+        score = cache_scores[cache_pos]
+    return score + valence_boost_scale * remaining ** -valence_boost_power
+
+def optimize_tris(tris, num_verts):
+    """Return tris (a list of vertex index triples) reordered for the
+    vertex cache. The triangles themselves (and so their winding) are not
+    changed.
+    """
+    vertex_tris = [[] for i in range(num_verts)]
+    for t, tri in enumerate(tris):
+        for v in tri:
+            vertex_tris[v].append(t)
+    remaining = [len(vt) for vt in vertex_tris]
+    cache_pos = [-1] * num_verts
+    scores = [vertex_score(-1, r) for r in remaining]
+    tri_scores = [scores[a] + scores[b] + scores[c] for a, b, c in tris]
+    emitted = [False] * len(tris)
+
+    order = []
+    cache = []
+    next_tri = 0  # for finding a fresh start when the cache has nothing
+    best = max(range(len(tris)), key=tri_scores.__getitem__, default=-1)
+    while best >= 0:
+        order.append(best)
+        emitted[best] = True
+        tri = tris[best]
+        for v in tri:
+            vertex_tris[v].remove(best)
+            remaining[v] -= 1
+        # the triangle's vertices move to the front of the cache, pushing
+        # the oldest ones out
+        cache = list(tri) + [v for v in cache if v not in tri]
+        for v in cache[cache_size:]:
+            cache_pos[v] = -1
+            score = vertex_score(-1, remaining[v])
+            for t in vertex_tris[v]:
+                tri_scores[t] += score - scores[v]
+            scores[v] = score
+        del cache[cache_size:]
+        for pos, v in enumerate(cache):
+            cache_pos[v] = pos
+            score = vertex_score(pos, remaining[v])
+            delta = score - scores[v]
+            scores[v] = score
+            for t in vertex_tris[v]:
+                tri_scores[t] += delta
+        # the best of the triangles using cached vertices (once all their
+        # vertices have been rescored)
+        best = -1
+        best_score = -1.0
+        for v in cache:
+            for t in vertex_tris[v]:
+                if tri_scores[t] > best_score:
+                    best = t
+                    best_score = tri_scores[t]
+        if best < 0:
+            # nothing in the cache has triangles left: start afresh with
+            # the next triangle not yet emitted
+            while next_tri < len(tris) and emitted[next_tri]:
+                next_tri += 1
+            if next_tri < len(tris):
+                best = next_tri
+    return [tris[t] for t in order]
+
+def first_use_order(submeshes, num_verts):
+    # the vertices in the order the triangles use them, then any unused
+    # vertices in their original order
+    order = []
+    seen = [False] * num_verts
+    for tris in submeshes:
+        for tri in tris:
+            for v in tri:
+                if not seen[v]:
+                    seen[v] = True
+                    order.append(v)
+    order.extend(v for v in range(num_verts) if not seen[v])
+    return order
+
+def cache_misses(tris, size=cache_size):
+    cache = deque()
+    cached = set()
+    misses = 0
+    for tri in tris:
+        for v in tri:
+            if v not in cached:
+                misses += 1
+                cache.append(v)
+                cached.add(v)
+                if len(cache) > size:
+                    cached.remove(cache.popleft())
+    return misses
+
+def acmr(submeshes, size=cache_size):
+    # each submesh is a separate draw call, so starts with an empty cache
+    num_tris = sum(len(tris) for tris in submeshes)
+    if not num_tris:
+        return 0.0
+    misses = sum(cache_misses(tris, size) for tris in submeshes)
+    return misses / num_tris
@@ -1,7 +1,7 @@
-from mu import Mu
+from mu import Mu, MuRewrite
 
 def check_clip(clip):
-    i = len(clip.curves)
+    i = count = len(clip.curves)
     while i > 0:
         i -= 1
         curve = clip.curves[i]
@@ -18,6 +18,7 @@ def check_clip(clip):
                 print("deleting " + curve.path + ", " + curve.property)
                 del clip.curves[i]
                 continue
+    return len(clip.curves) != count
 
 broken_xforms = [
     "coll torus",
@@ -31,23 +32,28 @@ broken_xforms = [
     "coll_torus8",
 ]
 
-def check_transform(obj):
-    if obj.transform.name in broken_xforms:
-        print("zeroing lp for " + obj.transform.name)
-        obj.transform.localPosition = 0, 0, 0
+def check_transform(transform):
+    if transform.name in broken_xforms:
+        print("zeroing lp for " + transform.name)
+        transform.localPosition = 0, 0, 0
+        return True
+    return False
 
-def check_obj(obj):
-    for o in obj.children:
-        check_obj(o)
-    check_transform(obj)
-    if hasattr(obj, "animation"):
-        for clip in obj.animation.clips:
-            check_clip(clip)
+def check_section(event, data):
+    # only the fixed transforms and animations are re-encoded
+    if event == "transform":
+        if check_transform(data):
+            return MuRewrite.ENCODE
+    elif event == "component" and data[0] == "animation":
+        changed = False
+        for clip in data[1].load().clips:
+            changed |= check_clip(clip)
+        if changed:
+            return MuRewrite.ENCODE
+    return MuRewrite.KEEP
 
 fname = "centrifuge.mu"
 mu = Mu()
-if not mu.read(fname):
+if mu.rewrite(fname, check_section, "output.mu") is None:
     print("could not read: " + fname)
     raise
-check_obj(mu.obj)
-mu.write("output.mu")
@@ -22,7 +22,7 @@ import bpy
 from bpy_extras.io_utils import ImportHelper
 from bpy.props import StringProperty
 
-from ..import_mu import MuImportError
+from ..import_mu import MuImportError, mesh_sharing
 from ..cfgnode import ConfigNode, ConfigNodeError
 from ..cfgnode import parse_vector, parse_quaternion
 from ..preferences import Preferences
@@ -53,17 +53,19 @@ def import_craft(filepath):
     vessel = bpy.data.collections.new(craft_name)
     craft_collection().children.link(vessel)
     root_pos = None
-    for p in craft.GetNodes("PART"):
-        pname = p.GetValue("part").split("_")[0]
-        pos = parse_vector(p.GetValue("pos"))
-        rot = parse_quaternion(p.GetValue("rot"))
-        part = gamedata.parts[pname].get_model()
-        if root_pos == None:
-            root_pos = pos
-        part.location = pos - root_pos
-        part.rotation_mode = 'QUATERNION'
-        part.rotation_quaternion = rot
-        vessel.objects.link(part)
+    # the parts' models share identical meshes
+    with mesh_sharing():
+        for p in craft.GetNodes("PART"):
+            pname = p.GetValue("part").split("_")[0]
+            pos = parse_vector(p.GetValue("pos"))
+            rot = parse_quaternion(p.GetValue("rot"))
+            part = gamedata.parts[pname].get_model()
+            if root_pos == None:
+                root_pos = pos
+            part.location = pos - root_pos
+            part.rotation_mode = 'QUATERNION'
+            part.rotation_quaternion = rot
+            vessel.objects.link(part)
     obj = bpy.data.objects.new(craft_name, None)
     obj.instance_type = 'COLLECTION'
     obj.instance_collection = vessel
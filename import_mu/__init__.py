@@ -21,9 +21,11 @@
 
 import bpy
 
-from .operators import KSPMU_OT_ImportMu
+from .operators import KSPMU_OT_ImportMu, KSPMU_OT_ClearImportCache
 from .import_mu import import_mu
 from .exception import MuImportError
+from .profiling import ImportProfile
+from .cache import mesh_sharing
 
 from . import import_modules
 
@@ -32,6 +34,7 @@ def import_mu_menu_func(self, context):
 
 classes_to_register = (
     KSPMU_OT_ImportMu,
+    KSPMU_OT_ClearImportCache,
 )
 
 menus_to_register = (
@@ -20,7 +20,8 @@
 # <pep8 compliant>
 
 import bpy
-from mathutils import Vector, Quaternion
+import numpy
+from mathutils import Quaternion
 from math import pi
 
 #mess with the heads of 6.28... fans :P
@@ -82,34 +83,92 @@ def shader_property(obj, prop):
                 return mat, path, rnaIndex
     return None
 
+def fcurve_keys(curve, mult):
+    # co, handle_left and handle_right of all the keys: shape (3, keys, 2)
+    fps = bpy.context.scene.render.fps
+    keys = numpy.array([(k.time, k.value, k.tangent[0], k.tangent[1])
+                        for k in curve.keys], dtype=numpy.float64)
+    time, value, tin, tout = keys.T
+    x = time * fps + bpy.context.scene.frame_start
+    y = value * mult
+    dist = numpy.diff(time) / 3
+    # the first key's left handle and the last key's right handle are flat
+    ldx = numpy.full(len(x), 10.0)
+    ldy = numpy.zeros(len(x))
+    rdx = numpy.full(len(x), 10.0)
+    rdy = numpy.zeros(len(x))
+    ldx[1:] = dist * fps
+    ldy[1:] = tin[1:] * dist * mult
+    rdx[:-1] = dist * fps
+    rdy[:-1] = tout[:-1] * dist * mult
+    return numpy.stack((numpy.stack((x, y), axis=1),
+                        numpy.stack((x - ldx, y - ldy), axis=1),
+                        numpy.stack((x + rdx, y + rdy), axis=1)))
+
+def set_fcurve_keys(fc, keys):
+    points = fc.keyframe_points
+    # enums go through foreach_set as their values: 'FREE' is 0
+    free = numpy.zeros(len(points), dtype=numpy.int32)
+    points.foreach_set("handle_left_type", free)
+    points.foreach_set("handle_right_type", free)
+    keys = keys.astype(numpy.float32)
+    points.foreach_set("co", keys[0].ravel())
+    points.foreach_set("handle_left", keys[1].ravel())
+    points.foreach_set("handle_right", keys[2].ravel())
+    fc.update()
+
 def create_fcurve(action, curve, propmap):
+    # the keys are returned rather than set so bone curves can be made
+    # relative to the bone before they are set (see set_fcurve_keys)
     dp, ind, mult = propmap
-    fps = bpy.context.scene.render.fps
     fc = action.fcurves.new(data_path = dp, index = ind)
     fc.keyframe_points.add(len(curve.keys))
-    for i, key in enumerate(curve.keys):
-        x,y = key.time * fps + bpy.context.scene.frame_start, key.value * mult
-        fc.keyframe_points[i].co = x, y
-        fc.keyframe_points[i].handle_left_type = 'FREE'
-        fc.keyframe_points[i].handle_right_type = 'FREE'
-        if i > 0:
-            dist = (key.time - curve.keys[i - 1].time) / 3
-            dx, dy = dist * fps, key.tangent[0] * dist * mult
-        else:
-            dx, dy = 10, 0.0
-        fc.keyframe_points[i].handle_left = x - dx, y - dy
-        if i < len(curve.keys) - 1:
-            dist = (curve.keys[i + 1].time - key.time) / 3
-            dx, dy = dist * fps, key.tangent[1] * dist * mult
-        else:
-            dx, dy = 10, 0.0
-        fc.keyframe_points[i].handle_right = x + dx, y + dy
-    return fc
+    return fc, fcurve_keys(curve, mult)
+
+def bone_curve_set(curves, kind):
+    if kind not in curves:
+        return None
+    curves = curves[kind]
+    kind = kind.split("_")[0]
+    if None in curves:
+        print("Skipping incomplete %s fcurve set" % kind)
+        return None
+    if len(set(len(keys[0]) for fc, keys in curves)) != 1:
+        print("Skipping mismatched %s fcurve set" % kind)
+        return None
+    # the values of co and the handles: shape (curves, 3, keys)
+    return numpy.stack([keys[:, :, 1] for fc, keys in curves])
+
+def update_bone_curves(curves, kind, values):
+    for i, (fc, keys) in enumerate(curves[kind]):
+        keys[:, :, 1] = values[i]
+
+def quaternion_matrix(q):
+    # q @ p as a matrix applied to p's (w, x, y, z)
+    w, x, y, z = q
+    return numpy.array(((w, -x, -y, -z),
+                        (x,  w, -z,  y),
+                        (y,  z,  w, -x),
+                        (z, -y,  x,  w)))
+
+def make_bone_relative(muobj, curves):
+    location = bone_curve_set(curves, "location")
+    if location is not None:
+        rrot = numpy.array(muobj.relRotation.to_matrix())
+        lloc = numpy.array(muobj.transform.localPosition).reshape(3, 1, 1)
+        location = numpy.tensordot(rrot, location - lloc, axes=1)
+        update_bone_curves(curves, "location", location)
+    rotation = bone_curve_set(curves, "rotation_quaternion")
+    if rotation is not None:
+        lrot = Quaternion(muobj.transform.localRotation).inverted()
+        rotation = numpy.tensordot(quaternion_matrix(lrot), rotation, axes=1)
+        update_bone_curves(curves, "rotation_quaternion", rotation)
 
 def create_action(mu, path, clip):
     #print(clip.name)
     actions = {}
-    bones = set()
+    fcurves = []
+    bones = {}
     for curve in clip.curves:
         if not curve.keys:
             print("Curve has no keys")
@@ -160,63 +219,17 @@ def create_action(mu, path, clip):
             actions[actpath] = bpy.data.actions.new(name), obj
         act, obj = actions[actpath]
         fcurve = create_fcurve(act, curve, fullpropmap)
+        fcurves.append(fcurve)
+        mu.profile.count("keyframes", len(curve.keys))
         if hasattr(muobj, "bone"):
-            if not hasattr(muobj, "fcurves"):
-                muobj.fcurves = {}
-            if propmap[0] not in muobj.fcurves:
-                muobj.fcurves[propmap[0]] = [None] * propmap[3]
-            muobj.fcurves[propmap[0]][propmap[1]] = fcurve
-            bones.add(muobj)
-    for muobj in bones:
-        xform = muobj.transform
-        rrot = muobj.relRotation
-        if "location" in muobj.fcurves:
-            location = muobj.fcurves["location"]
-            lloc = Vector(muobj.transform.localPosition)
-            if None in location:
-                print("Skipping incomplete location fcurve set")
-            elif ((len(location[0].keyframe_points)
-                  != len(location[1].keyframe_points))
-                  or (len(location[0].keyframe_points)
-                      != len(location[2].keyframe_points))):
-                print("Skipping mismatched location fcurve set")
-            else:
-                for i in range(len(location[0].keyframe_points)):
-                    def transformkey(kval):
-                        xk = getattr(location[0].keyframe_points[i], kval)
-                        yk = getattr(location[1].keyframe_points[i], kval)
-                        zk = getattr(location[2].keyframe_points[i], kval)
-                        loc = Vector((xk.y, yk.y, zk.y))
-                        loc = rrot @ (loc - lloc)
-                        (xk.y, yk.y, zk.y) = loc
-                    transformkey("co")
-                    transformkey("handle_left")
-                    transformkey("handle_right")
-        if "rotation_quaternion" in muobj.fcurves:
-            rotation = muobj.fcurves["rotation_quaternion"]
-            lrot = Quaternion(muobj.transform.localRotation).inverted()
-            if None in rotation:
-                print("Skipping incomplete rotation fcurve set")
-            elif ((len(rotation[0].keyframe_points)
-                  != len(rotation[1].keyframe_points))
-                  or (len(rotation[0].keyframe_points)
-                      != len(rotation[2].keyframe_points))
-                  or (len(rotation[0].keyframe_points)
-                      != len(rotation[3].keyframe_points))):
-                print("Skipping mismatched rotation fcurve set")
-            else:
-                for i in range(len(rotation[0].keyframe_points)):
-                    def rotkey(kval):
-                        wk = getattr(rotation[0].keyframe_points[i], kval)
-                        xk = getattr(rotation[1].keyframe_points[i], kval)
-                        yk = getattr(rotation[2].keyframe_points[i], kval)
-                        zk = getattr(rotation[3].keyframe_points[i], kval)
-                        q = Quaternion((wk.y, xk.y, yk.y, zk.y))
-                        q = lrot @ q
-                        (wk.y, xk.y, yk.y, zk.y) = q
-                    rotkey("co")
-                    rotkey("handle_left")
-                    rotkey("handle_right")
+            curves = bones.setdefault(muobj, {})
+            if propmap[0] not in curves:
+                curves[propmap[0]] = [None] * propmap[3]
+            curves[propmap[0]][propmap[1]] = fcurve
+    for muobj, curves in bones.items():
+        make_bone_relative(muobj, curves)
+    for fc, keys in fcurves:
+        set_fcurve_keys(fc, keys)
     for name in actions:
         act, obj = actions[name]
         if not obj.animation_data:
@@ -20,6 +20,8 @@
 # <pep8 compliant>
 
 import bpy
+import bmesh
+import numpy
 from mathutils import Vector, Quaternion, Matrix
 from ..utils import create_data_object, translate, scale, rotate
 
@@ -30,15 +32,57 @@ Matrix_YZ = Matrix(((1,0,0,0),
                     (0,1,0,0),
                     (0,0,0,1)))
 
+def bone_weight_arrays(weights):
+    # weights is the file's interleaved index/weight-bits ints (see
+    # mu.channel_array): returns vertex, bone index and weight arrays for
+    # the non-zero influences
+    data = numpy.frombuffer(weights, dtype=numpy.int32).reshape(-1, 2)
+    bones = data[:, 0]
+    bweights = data[:, 1].copy().view(numpy.float32)
+    verts = numpy.arange(len(data), dtype=numpy.int32) // 4
+    used = bweights != 0
+    return verts[used], bones[used], bweights[used]
+
+def add_weights_bmesh(mesh, verts, bones, bweights):
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    deform = bm.verts.layers.deform.verify()
+    bm.verts.ensure_lookup_table()
+    bmverts = bm.verts
+    for vind, bind, bweight in zip(verts.tolist(), bones.tolist(),
+                                   bweights.tolist()):
+        dvert = bmverts[vind][deform]
+        dvert[bind] = dvert.get(bind, 0) + bweight
+    bm.to_mesh(mesh)
+    bm.free()
+
+def add_weights_grouped(vertex_groups, verts, bones, bweights):
+    # one add() per bone and weight value
+    order = numpy.lexsort((bweights, bones))
+    verts, bones, bweights = verts[order], bones[order], bweights[order]
+    starts = numpy.flatnonzero((bones[1:] != bones[:-1])
+                               | (bweights[1:] != bweights[:-1])) + 1
+    starts = [0] + starts.tolist()
+    ends = starts[1:] + [len(verts)]
+    for start, end in zip(starts, ends):
+        group = vertex_groups[int(bones[start])]
+        group.add(verts[start:end].tolist(), float(bweights[start]), 'ADD')
+
 def create_vertex_groups(obj, bones, weights):
     mesh = obj.data
     for bone in bones:
         obj.vertex_groups.new(name=bone)
-    for vind, weight in enumerate(weights):
-        for i in range(4):
-            bind, bweight = weight.indices[i], weight.weights[i]
-            if bweight != 0:
-                obj.vertex_groups[bind].add((vind,), bweight, 'ADD')
+    verts, bones, bweights = bone_weight_arrays(weights)
+    if not len(verts):
+        return
+    # when the weights are mostly unique, grouping them saves little, so
+    # write them straight into the deform layer instead
+    pairs = numpy.unique(bones.astype(numpy.int64) << 32
+                         | bweights.view(numpy.uint32))
+    if len(pairs) > len(mesh.vertices) // 8:
+        add_weights_bmesh(mesh, verts, bones, bweights)
+    else:
+        add_weights_grouped(obj.vertex_groups, verts, bones, bweights)
 
 def create_armature_modifier(obj, name, armature):
     mod = obj.modifiers.new(name=name, type='ARMATURE')
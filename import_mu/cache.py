@@ -0,0 +1,154 @@
+# vim:ts=4:et
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Session-level cache of the images, materials and meshes created by .mu
+# imports, so models sharing textures (eg, the parts of a craft) load each
+# texture and build each material only once, and identical meshes (bolts,
+# rivets, repeated panels) share one mesh datablock.
+#
+# Meshes are shared only within one import, or the imports made inside
+# mesh_sharing() (eg, all the parts of a craft): a mesh from an earlier
+# import may since have been edited, and linking a new object to it would
+# silently give the object the edited geometry.
+#
+# Images are keyed by their resolved file path, the file's modification
+# time and the texture type, so an edited texture is reloaded. Materials are
+# keyed by name, shader name, property values and the keys of their
+# textures.
+# Meshes are keyed by a hash of the channels the import uses plus the names
+# of their materials.
+# Only the datablock names are kept (references to datablocks may not
+# survive undo), and an entry whose datablock has since been deleted or
+# renamed is dropped on lookup.
+
+from contextlib import contextmanager
+import hashlib
+import os
+
+import bpy
+
+from ..mu import channel_array
+
+image_cache = {}
+material_cache = {}
+mesh_cache = {}
+mesh_sharing_depth = 0
+
+def clear_cache():
+    image_cache.clear()
+    material_cache.clear()
+    mesh_cache.clear()
+
+def image_key(filepath, type):
+    filepath = os.path.realpath(filepath)
+    return filepath, os.path.getmtime(filepath), type
+
+def cached_image(key):
+    if key not in image_cache:
+        return None
+    img = bpy.data.images.get(image_cache[key])
+    if not img:
+        del image_cache[key]
+    return img
+
+def cache_image(key, img):
+    image_cache[key] = img.name
+
+def property_key(props):
+    items = []
+    for name, value in props.items():
+        if hasattr(value, "__len__"):
+            value = tuple(value)
+        items.append((name, value))
+    return tuple(sorted(items))
+
+def texture_key(mu, mattex):
+    if 0 <= mattex.index < len(mu.textures):
+        tex = mu.textures[mattex.index]
+        # the texture's image key when it was loaded
+        tex = getattr(tex, "cache_key", (tex.name, tex.type))
+    else:
+        tex = None
+    return tex, tuple(mattex.scale), tuple(mattex.offset)
+
+def material_key(mu, mumat):
+    textures = []
+    for name, mattex in mumat.textureProperties.items():
+        textures.append((name, texture_key(mu, mattex)))
+    # the name too: materials differing only in name must stay separate
+    # so that the export writes both names back
+    return (mumat.name, mumat.shaderName,
+            property_key(mumat.colorProperties),
+            property_key(mumat.vectorProperties),
+            property_key(mumat.floatProperties2),
+            property_key(mumat.floatProperties3),
+            tuple(sorted(textures)))
+
+def cached_material(key):
+    if key not in material_cache:
+        return None
+    mat = bpy.data.materials.get(material_cache[key])
+    if not mat:
+        del material_cache[key]
+    return mat
+
+def cache_material(key, mat):
+    material_cache[key] = mat.name
+
+# the channels create_mesh turns into mesh data
+mesh_channels = ["verts", "uvs", "uv2s", "normals", "submeshes"]
+
+def mesh_key(mumesh, materials):
+    digest = hashlib.blake2b(digest_size=16)
+    for name in mesh_channels:
+        data = channel_array(mumesh, name)
+        if name != "submeshes":
+            data = [data]
+        # the lengths keep eg, uvs moving into uv2s from hashing the same
+        digest.update(name.encode())
+        for a in data:
+            digest.update(len(a).to_bytes(8, "little"))
+            digest.update(a)
+    return digest.digest(), tuple(materials)
+
+def cached_mesh(key):
+    if key not in mesh_cache:
+        return None
+    mesh = bpy.data.meshes.get(mesh_cache[key])
+    if not mesh:
+        del mesh_cache[key]
+    return mesh
+
+def cache_mesh(key, mesh):
+    mesh_cache[key] = mesh.name
+
+@contextmanager
+def mesh_sharing():
+    # the meshes of the imports inside the outermost mesh_sharing() are
+    # shared, and forgotten when it ends
+    global mesh_sharing_depth
+    mesh_sharing_depth += 1
+    try:
+        yield
+    finally:
+        mesh_sharing_depth -= 1
+        if not mesh_sharing_depth:
+            mesh_cache.clear()
@@ -23,7 +23,7 @@ from ..mu import MuColliderMesh, MuColliderSphere, MuColliderCapsule
 from ..mu import MuColliderBox, MuColliderWheel
 from .. import collider, properties
 
-from .mesh import create_mesh
+from .mesh import instance_mesh
 
 def copy_spring(dst, src):
     dst.spring = src.spring
@@ -43,7 +43,7 @@ def create_collider(mu, muobj, col, name):
     mesh = None
     if type(col) == MuColliderMesh:
         name = name + ".collider"
-        mesh = create_mesh(mu, col.mesh, name)
+        mesh = instance_mesh(mu, col.mesh, name)
     obj, cobj = collider.create_collider_object(name, mesh)
 
     obj.muproperties.isTrigger = False
@@ -40,6 +40,9 @@ from .collider import create_collider
 from .light import create_light
 from .mesh import create_mesh
 from .textures import create_textures
+from .cache import material_key, cached_material, cache_material
+from .cache import mesh_sharing
+from .profiling import NullProfile
 
 def skip_component(mu, muobj, mumesh, name):
     return None
@@ -124,6 +127,7 @@ def create_object(mu, muobj, parent):
                                       xform)
     if obj.name not in mu.collection.objects:
         mu.collection.objects.link(obj)
+    mu.profile.count("objects")
 
     if not obj.data:
         if xform.name[:5] == "node_":
@@ -162,7 +166,14 @@ def create_object(mu, muobj, parent):
 def create_materials(mu):
     #material info is in the top level object
     for mumat in mu.materials:
-        mumat.material = make_shader(mumat, mu)
+        key = material_key(mu, mumat)
+        mumat.material = cached_material(key)
+        if not mumat.material:
+            mumat.material = make_shader(mumat, mu)
+            cache_material(key, mumat.material)
+            mu.profile.count("materials")
+        else:
+            mu.profile.count("cached materials")
 
 def create_armatures(mu):
     def scan_for_skins(mu, obj):
@@ -182,22 +193,48 @@ def create_armatures(mu):
         scan_for_skins(mu, mu.obj)
 
 def process_mu(mu, mudir):
-    create_textures(mu, mudir)
-    create_materials(mu)
-    create_object_paths(mu)
-    create_armatures(mu)
+    profile = mu.profile
+    with profile.phase("create_textures"):
+        create_textures(mu, mudir)
+    with profile.phase("create_materials"):
+        create_materials(mu)
+    with profile.phase("create_object_paths"):
+        create_object_paths(mu)
+    with profile.phase("create_armatures"):
+        create_armatures(mu)
     mu.imported_objects = set()
-    return create_object(mu, mu.obj, None)
-
-def import_mu(collection, filepath, create_colliders, force_armature, force_mesh=False):
+    with profile.phase("create_object"):
+        return create_object(mu, mu.obj, None)
+
+def import_mu(collection, filepath, create_colliders, force_armature, force_mesh=False, profile=None, share_meshes=True):
+    """Import the .mu file at filepath into collection.
+
+    profile is an optional ImportProfile (see profiling.py) to collect the
+    import's phase timings and counts. Its summary is added to mu.messages.
+    With share_meshes, meshes identical to one already imported in this
+    import (or in the enclosing mesh_sharing(), eg a craft) reuse its mesh
+    datablock.
+    """
     mu = Mu()
     mu.messages = []
     mu.create_colliders = create_colliders
     mu.force_armature = force_armature
     mu.force_mesh = force_mesh
+    mu.share_meshes = share_meshes
     mu.collection = collection
-    if not mu.read(filepath):
-        raise MuImportError("Mu", "Unrecognized format: magic %x version %d"
-                                  % (mu.magic, mu.version))
-
-    return process_mu(mu, os.path.dirname(filepath)), mu
+    mu.profile = profile or NullProfile()
+    if profile:
+        profile.begin(filepath)
+    try:
+        with mu.profile.phase("read"):
+            if not mu.read(filepath):
+                raise MuImportError("Mu", "Unrecognized format: magic %x version %d"
+                                          % (mu.magic, mu.version))
+        with mesh_sharing():
+            obj = process_mu(mu, os.path.dirname(filepath))
+    finally:
+        if profile:
+            profile.end()
+    if profile:
+        mu.messages.extend(profile.messages())
+    return obj, mu
@@ -21,50 +21,94 @@
 
 import bpy
 import bmesh
+import numpy
 
-from ..mu import MuMesh, MuSkinnedMeshRenderer
+from ..mu import MuMesh, MuSkinnedMeshRenderer, channel_array
 from ..utils import create_data_object
 
 from .armature import create_vertex_groups, create_armature_modifier
 from .armature import create_bindPose
+from .cache import mesh_key, cached_mesh, cache_mesh
 
-def attach_material(mesh, renderer, mu):
+def renderer_materials(renderer, mu):
     if mu.materials and renderer.materials:
         #KSP supports only the first submesh and thus only the first
         #material
-        mumat = mu.materials[renderer.materials[0]]
-        mesh.materials.append(mumat.material)
+        return [mu.materials[renderer.materials[0]].material]
+    return []
+
+def attach_material(mesh, renderer, mu):
+    for mat in renderer_materials(renderer, mu):
+        mesh.materials.append(mat)
 
-def create_uvs(mu, uvs, mesh, name):
-    uv_layer = mesh.uv_layers.new(name=name).data
-    for i, loop in enumerate(mesh.loops):
-        uv_layer[i].uv = uvs[loop.vertex_index]
+def create_uvs(mu, uvs, mesh, name, loop_verts):
+    uv_layer = mesh.uv_layers.new(name=name)
+    # gather the per-vertex uvs into per-loop uvs
+    uvs = numpy.frombuffer(uvs, dtype=numpy.float32).reshape(-1, 2)
+    uv_layer.data.foreach_set("uv", uvs[loop_verts].ravel())
 
 def create_normals(mu, normals, mesh):
-    custom_normals = [None] * len(mesh.loops)
-    for i, loop in enumerate(mesh.loops):
-        custom_normals[i] = normals[loop.vertex_index]
-    mesh.normals_split_custom_set(custom_normals)
+    # every loop of a vertex gets the vertex's normal
+    normals = numpy.frombuffer(normals, dtype=numpy.float32).reshape(-1, 3)
+    mesh.normals_split_custom_set_from_vertices(normals)
     mesh.use_auto_smooth = True
 
 def create_mesh(mu, mumesh, name):
     mesh = bpy.data.meshes.new(name)
-    faces = []
-    for sm in mumesh.submeshes:
-        faces.extend(sm)
-    mesh.from_pydata(mumesh.verts, [], faces)
-    if mumesh.uvs:
-        create_uvs(mu, mumesh.uvs, mesh, "UVMap")
-    if mumesh.uv2s:
-        create_uvs(mu, mumesh.uv2s, mesh, "UVMap2")
-    if mumesh.normals:
-        create_normals(mu, mumesh.normals, mesh)
+    verts = channel_array(mumesh, "verts")
+    submeshes = channel_array(mumesh, "submeshes")
+    if submeshes:
+        loop_verts = numpy.concatenate([numpy.frombuffer(tris, numpy.int32)
+                                        for tris in submeshes])
+    else:
+        loop_verts = numpy.zeros(0, dtype=numpy.int32)
+    num_loops = len(loop_verts)
+    num_faces = num_loops // 3
+    mesh.vertices.add(len(verts) // 3)
+    mesh.vertices.foreach_set("co", verts)
+    mesh.loops.add(num_loops)
+    mesh.loops.foreach_set("vertex_index", loop_verts)
+    mesh.polygons.add(num_faces)
+    mesh.polygons.foreach_set("loop_start",
+                              numpy.arange(0, num_loops, 3, dtype=numpy.int32))
+    mesh.polygons.foreach_set("loop_total",
+                              numpy.full(num_faces, 3, dtype=numpy.int32))
+    mesh.update(calc_edges=True)
+    mu.profile.count("verts", len(mesh.vertices))
+    mu.profile.count("loops", num_loops)
+    uvs = channel_array(mumesh, "uvs")
+    if uvs:
+        create_uvs(mu, uvs, mesh, "UVMap", loop_verts)
+    uv2s = channel_array(mumesh, "uv2s")
+    if uv2s:
+        create_uvs(mu, uv2s, mesh, "UVMap2", loop_verts)
+    normals = channel_array(mumesh, "normals")
+    if normals:
+        create_normals(mu, normals, mesh)
     #FIXME how to set tangents?
     #if mumesh.tangents:
     #    for i, t in enumerate(mumesh.tangents):
     #        bv[i].tangent = t
     return mesh
 
+def instance_mesh(mu, mumesh, name, materials=()):
+    # identical meshes (same geometry and materials) link to one datablock.
+    # Skinned meshes aren't shared: their vertex weights are stored in the
+    # mesh
+    key = None
+    if mu.share_meshes:
+        key = mesh_key(mumesh, [mat.name for mat in materials])
+        mesh = cached_mesh(key)
+        if mesh:
+            mu.profile.count("shared meshes")
+            return mesh
+    mesh = create_mesh(mu, mumesh, name)
+    for mat in materials:
+        mesh.materials.append(mat)
+    if key:
+        cache_mesh(key, mesh)
+    return mesh
+
 def mesh_post(obj, renderer):
     obj.muproperties.castShadows = renderer.castShadows
     obj.muproperties.receiveShadows = renderer.receiveShadows
@@ -72,18 +116,20 @@ def mesh_post(obj, renderer):
 def create_mesh_component(mu, muobj, mumesh, name):
     if not mu.force_mesh and not hasattr(muobj, "renderer"):
         return None
-    mesh = create_mesh (mu, mumesh, name)
     if hasattr(muobj, "renderer"):
-        attach_material(mesh, muobj.renderer, mu)
+        materials = renderer_materials(muobj.renderer, mu)
+        mesh = instance_mesh(mu, mumesh, name, materials)
         return "mesh", mesh, None, (mesh_post, muobj.renderer)
     else:
+        mesh = instance_mesh(mu, mumesh, name)
         return "mesh", mesh, None
 
 def create_skinned_mesh_component(mu, muobj, skin, name):
     create_bindPose(mu, muobj, skin)
     mesh = create_mesh(mu, skin.mesh, name)
     obj = create_data_object(mu.collection, name + ".skin", mesh, None)
-    create_vertex_groups(obj, skin.bones, skin.mesh.boneWeights)
+    create_vertex_groups(obj, skin.bones,
+                         channel_array(skin.mesh, "boneWeights"))
     attach_material(mesh, skin, mu)
     obj.parent = skin.bindPose_obj
     create_armature_modifier(obj, "BindPose", skin.bindPose_obj)
@@ -26,15 +26,22 @@ from bpy.props import BoolProperty, StringProperty
 
 from .exception import MuImportError
 from .import_mu import import_mu
+from .cache import clear_cache
+from .profiling import ImportProfile
 
-def import_mu_op(self, context, filepath, create_colliders, force_armature, force_mesh):
+def import_mu_op(self, context, filepath, create_colliders, force_armature, force_mesh,
+                 share_meshes=True, profile=False, profile_python=False,
+                 profile_json=""):
     operator = self
     undo = bpy.context.preferences.edit.use_global_undo
     bpy.context.preferences.edit.use_global_undo = False
 
     collection = bpy.context.layer_collection.collection
+    import_profile = None
+    if profile:
+        import_profile = ImportProfile(use_cprofile=profile_python)
     try:
-        ret = import_mu(collection, filepath, create_colliders, force_armature, force_mesh)
+        ret = import_mu(collection, filepath, create_colliders, force_armature, force_mesh, import_profile, share_meshes)
     except MuImportError as e:
         operator.report({'ERROR'}, e.message)
         return {'CANCELLED'}
@@ -47,6 +54,8 @@ def import_mu_op(self, context, filepath, create_colliders, force_armature, forc
         obj.rotation_quaternion = Quaternion((1, 0, 0, 0))
         obj.scale = Vector((1, 1, 1))
         obj.select_set(True)
+        if import_profile and profile_json:
+            import_profile.write_json(bpy.path.abspath(profile_json))
         for m in mu.messages:
             operator.report(m[0], m[1])
         return {'FINISHED'}
@@ -72,8 +81,33 @@ class KSPMU_OT_ImportMu(bpy.types.Operator, ImportHelper):
     force_mesh: BoolProperty(name="Force Invisible Mesh",
             description="Enable to force creation of mesh objects that have"
                         " no renderer", default=False)
+    share_meshes: BoolProperty(name="Share Meshes",
+            description="Link identical meshes within the import to a"
+                        " single mesh datablock instead of creating a copy"
+                        " for each",
+                        default=True)
+    profile: BoolProperty(name="Profile Import",
+            description="Report the time taken by each import phase and"
+                        " counts of what was created", default=False)
+    profile_python: BoolProperty(name="Python Profile",
+            description="Also capture a cProfile profile of the import"
+                        " (slows the import)", default=False)
+    profile_json: StringProperty(name="Profile File",
+            description="Write the import profile to this JSON file",
+            subtype='FILE_PATH', default="")
 
     def execute(self, context):
         keywords = self.as_keywords (ignore=("filter_glob",
                                              "axis_forward", "axis_up"))
         return import_mu_op(self, context, **keywords)
+
+class KSPMU_OT_ClearImportCache(bpy.types.Operator):
+    '''Forget the images and materials created by previous Mu imports'''
+    bl_idname = "import_object.ksp_mu_clear_cache"
+    bl_label = "Clear Mu Import Cache"
+    bl_description = """Make the next Mu import reload its textures and
+rebuild its materials instead of reusing those from earlier imports."""
+
+    def execute(self, context):
+        clear_cache()
+        return {'FINISHED'}
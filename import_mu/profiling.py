@@ -0,0 +1,132 @@
+# vim:ts=4:et
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Opt-in import instrumentation: wall-clock time per import phase, counts of
+# what was created and, optionally, a cProfile capture of the whole import.
+# Pass an ImportProfile to import_mu; without one, mu.profile is a
+# NullProfile and the instrumentation costs next to nothing.
+#
+# Headless use:
+#   profile = ImportProfile(use_cprofile=True)
+#   obj, mu = import_mu(collection, filepath, True, False, profile=profile)
+#   profile.write_json(filepath + ".profile.json")
+
+from contextlib import contextmanager
+from time import perf_counter
+import cProfile
+import json
+import pstats
+import tracemalloc
+
+class NullProfile:
+    @contextmanager
+    def phase(self, name):
+        yield
+    def count(self, name, num=1):
+        pass
+
+class ImportProfile:
+    def __init__(self, use_cprofile=False, trace_memory=False):
+        self.filepath = None
+        # phase name: seconds (a phase may be entered more than once)
+        self.phases = {}
+        # phase name: peak bytes allocated by python code (tracemalloc: not
+        # blender's own allocations)
+        self.memory = {}
+        self.trace_memory = trace_memory
+        self.counts = {}
+        self.profiler = None
+        if use_cprofile:
+            self.profiler = cProfile.Profile()
+        self.start = None
+        self.total = 0.0
+    def begin(self, filepath):
+        self.filepath = filepath
+        self.started_tracing = False
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        self.start = perf_counter()
+        if self.profiler:
+            self.profiler.enable()
+    def end(self):
+        if self.profiler:
+            self.profiler.disable()
+        self.total += perf_counter() - self.start
+        if self.started_tracing:
+            tracemalloc.stop()
+    @contextmanager
+    def phase(self, name):
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            # reset_peak is python 3.9+: older versions report the peak
+            # since the import started
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1] - base
+                self.memory[name] = max(self.memory.get(name, 0), peak)
+    def count(self, name, num=1):
+        self.counts[name] = self.counts.get(name, 0) + num
+    def functions(self, limit=40):
+        # the functions with the most cumulative time
+        if not self.profiler:
+            return []
+        stats = pstats.Stats(self.profiler).stats
+        funcs = []
+        for (filename, line, func), data in stats.items():
+            cc, nc, tt, ct, callers = data
+            funcs.append({
+                "function": func,
+                "file": filename,
+                "line": line,
+                "calls": nc,
+                "time": tt,
+                "cumulative": ct,
+            })
+        funcs.sort(key=lambda f: f["cumulative"], reverse=True)
+        return funcs[:limit]
+    def messages(self):
+        msgs = [({'INFO'}, "import: %.3fs" % self.total)]
+        for name, elapsed in self.phases.items():
+            msgs.append(({'INFO'}, "    %s: %.3fs" % (name, elapsed)))
+        for name, num in self.counts.items():
+            msgs.append(({'INFO'}, "    %s: %d" % (name, num)))
+        return msgs
+    def data(self):
+        return {
+            "filepath": self.filepath,
+            "total": self.total,
+            "phases": self.phases,
+            "memory": self.memory,
+            "counts": self.counts,
+            "functions": self.functions(),
+        }
+    def write_json(self, filepath):
+        with open(filepath, "wt") as f:
+            json.dump(self.data(), f, indent=1)
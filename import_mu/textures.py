@@ -19,34 +19,48 @@
 
 # <pep8 compliant>
 
+from concurrent.futures import ThreadPoolExecutor
 from struct import unpack
-import os.path
+import os
 
 import bpy
-from mathutils import Vector
+import numpy
+
+from .cache import image_key, cached_image, cache_image
 
 def load_mbm(mbmpath):
-    mbmfile = open(mbmpath, "rb")
-    header = mbmfile.read(20)
-    magic, width, height, bump, bpp = unpack("<5i", header)
-    if magic != 0x50534b03: # "\x03KSP" as little endian
-        raise
-    if bpp == 32:
-        pixels = mbmfile.read(width * height * 4)
-    elif bpp == 24:
-        pixels = [0, 0, 0, 255] * width * height
-        for i in range(width * height):
-            p = mbmfile.read(3)
-            l = i * 4
-            pixels[l:l+3] = list(p)
-    else:
-        raise
-    return width, height, pixels
+    # returns the pixels as a flat array of floats (0..1), RGBA
+    with open(mbmpath, "rb") as mbmfile:
+        header = mbmfile.read(20)
+        if len(header) < 20:
+            raise EOFError
+        magic, width, height, bump, bpp = unpack("<5i", header)
+        if magic != 0x50534b03: # "\x03KSP" as little endian
+            raise
+        if bpp not in [24, 32]:
+            raise
+        size = width * height * bpp // 8
+        data = mbmfile.read(size)
+        if len(data) < size:
+            raise EOFError
+    data = numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, bpp // 8)
+    pixels = numpy.ones((width * height, 4), dtype=numpy.float32)
+    # 24 bpp has no alpha: it stays 1 (255)
+    pixels[:, :bpp // 8] = data
+    pixels[:, :bpp // 8] /= 255
+    return width, height, pixels.ravel()
+
+def needs_norm_conversion(pixels):
+    # sample the first 256 pixels: if they aren't unit vectors, the normal
+    # map needs converting
+    c = numpy.asarray(pixels[:1024], dtype=numpy.float32).reshape(-1, 4)
+    c = 2 * c[:, :3] - 1
+    return bool(numpy.any(abs((c * c).sum(axis=1) - 1) > 0.05))
 
-def load_image(base, ext, path, type):
-    name = base + ext
+def load_image(base, ext, filepath, type, decoded=None):
+    # decoded is load_mbm's result when it has already been run
     if ext.lower() in [".dds", ".png", ".tga"]:
-        img = bpy.data.images.load(os.path.join(path, name))
+        img = bpy.data.images.load(filepath)
         img.name = base
         img.muimageprop.invertY = False
         if ext.lower() == ".dds":
@@ -55,9 +69,11 @@ def load_image(base, ext, path, type):
         if base[-2:].lower() == "_n" or base[-3:].lower() == "nrm":
             type = 1
     elif ext.lower() == ".mbm":
-        w,h, pixels = load_mbm(os.path.join(path, name))
+        if decoded is None:
+            decoded = load_mbm(filepath)
+        w,h, pixels = decoded
         img = bpy.data.images.new(base, w, h)
-        img.pixels[:] = map(lambda x: x / 255.0, pixels)
+        img.pixels.foreach_set(pixels)
         img.pack()
     img.alpha_mode = 'STRAIGHT'
     img.muimageprop.invertY = (ext.lower() == ".dds")
@@ -65,26 +81,94 @@ def load_image(base, ext, path, type):
     img.colorspace_settings.is_data = False
     if type == 1:
         img.colorspace_settings.is_data = True
-        for i in range(min(int(len(pixels)/4), 256)):
-            c = 2*Vector(pixels[i*4:i*4+4])-Vector((1, 1, 1, 1))
-            if abs(c.x*c.x + c.y*c.y + c.z*c.z - 1) > 0.05:
-                img.muimageprop.convertNorm = True
+        img.muimageprop.convertNorm = needs_norm_conversion(pixels)
+    return img
 
-def create_textures(mu, path):
+# Decoding MBM files needs neither blender nor the GIL for most of the work
+# (file reads and numpy), so it is done in the background while the main
+# thread creates the images. The pool lives only for the import (its
+# threads are started on the first decode), so nothing is left running
+# when the addon is disabled or reloaded.
+
+def directory_listing(dirpath):
+    # the directory's files by name and by lowercase name
+    try:
+        names = os.listdir(dirpath or ".")
+    except OSError:
+        return {}
+    listing = {name.lower(): name for name in names}
+    listing.update((name, name) for name in names)
+    return listing
+
+def texture_candidates(tex, path, listings):
+    # the existing files for the texture, in the order they are to be tried
     extensions = [".dds", ".mbm", ".tga", ".png"]
-    #texture info is in the top level object
-    for tex in mu.textures:
-        base, ext = os.path.splitext(tex.name)
-        ind = 0
-        if ext in extensions:
-            ind = extensions.index(ext)
-        lst = extensions[ind:] + extensions[:ind]
-        for e in lst:
-            try:
-                load_image(base, e, path, tex.type)
+    base, ext = os.path.splitext(tex.name)
+    ind = 0
+    if ext in extensions:
+        ind = extensions.index(ext)
+    lst = extensions[ind:] + extensions[:ind]
+    candidates = []
+    for e in lst:
+        filepath = os.path.join(path, base + e)
+        # one directory listing replaces probing for each extension
+        dirpath, filename = os.path.split(filepath)
+        if dirpath not in listings:
+            listings[dirpath] = directory_listing(dirpath)
+        listing = listings[dirpath]
+        # an exact match first, then one differing only in case (as the
+        # file system would find it on Windows and macOS)
+        filename = listing.get(filename) or listing.get(filename.lower())
+        if filename:
+            candidates.append((base, e, os.path.join(dirpath, filename)))
+    return candidates
+
+def create_textures(mu, path):
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        listings = {}
+        textures = []
+        pending = {}
+        #texture info is in the top level object
+        for tex in mu.textures:
+            candidates = []
+            for base, e, filepath in texture_candidates(tex, path, listings):
+                try:
+                    key = image_key(filepath, tex.type)
+                except OSError:
+                    continue
+                candidates.append((base, e, filepath, key))
+            decoded = None
+            # only the first choice is decoded ahead: the others are needed
+            # only if it fails to load
+            if candidates and not cached_image(candidates[0][3]):
+                base, e, filepath, key = candidates[0]
+                if e == ".mbm":
+                    if key not in pending:
+                        pending[key] = pool.submit(load_mbm, filepath)
+                    decoded = pending[key]
+            textures.append((tex, candidates, decoded))
+        # the images must be created on the main thread
+        for tex, candidates, decoded in textures:
+            for i, (base, e, filepath, key) in enumerate(candidates):
+                img = cached_image(key)
+                if not img:
+                    try:
+                        if i == 0 and decoded:
+                            decoded = decoded.result()
+                        else:
+                            decoded = None
+                        img = load_image(base, e, filepath, tex.type,
+                                         decoded)
+                    except FileNotFoundError:
+                        continue
+                    except RuntimeError:
+                        continue
+                    except EOFError:
+                        # truncated file
+                        continue
+                    cache_image(key, img)
+                    mu.profile.count("images")
+                else:
+                    mu.profile.count("cached images")
+                tex.cache_key = key
                 break
-            except FileNotFoundError:
-                continue
-            except RuntimeError:
-                continue
-    pass
@@ -0,0 +1,277 @@
+# vim:ts=4:et
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Import benchmark for a corpus of .mu files.
+#
+# Import (in blender, with the addon installed):
+#   blender --background --factory-startup --python importbench.py -- \
+#       [--addon io_object_mu] [--repeat N] [--cprofile] \
+#       [--json out.json] [--csv out.csv] path...
+# Each file is imported through import_mu with an ImportProfile: time and
+# peak python memory (tracemalloc) per import phase, plus the profile's
+# counts. The imported data is removed before the next file.
+#
+# Decode only (plain python, no blender):
+#   python importbench.py --decode [--repeat N] [--json out.json] path...
+# Times mu.py on the same files: Mu.read plain, memory mapped and lazy, and
+# decode (a plain read with every mesh channel converted to lists).
+#
+# Compare two runs (either kind):
+#   python importbench.py --compare old.json new.json [--threshold 0.1]
+# Phases that got slower by more than threshold (and by more than
+# --min-time seconds) are flagged. The exit status is 1 if any were.
+#
+# Paths may be files, globs or directories (see mubatch.find_files). With
+# --repeat, the best time and the largest peak of the runs are kept.
+
+from time import perf_counter
+import argparse
+import csv
+import importlib
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mu import Mu
+from mubatch import find_files
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+def file_record(path):
+    return {
+        "file": path,
+        "size": os.path.getsize(path) if os.path.exists(path) else 0,
+        "total": 0.0,
+        "phases": {},
+        "memory": {},
+        "counts": {},
+        "error": None,
+    }
+
+def merge_run(record, total, phases, memory, counts):
+    # keep the best time and the largest peak over the repeats
+    if not record["phases"] or total < record["total"]:
+        record["total"] = total
+    for name, elapsed in phases.items():
+        best = record["phases"].get(name, elapsed)
+        record["phases"][name] = min(best, elapsed)
+    for name, peak in memory.items():
+        record["memory"][name] = max(record["memory"].get(name, 0), peak)
+    record["counts"] = dict(counts)
+
+def decode_mesh(mesh):
+    for name in ["verts", "uvs", "uv2s", "normals", "tangents",
+                 "boneWeights", "submeshes", "colors"]:
+        getattr(mesh, name)
+
+def decode_object(obj):
+    if hasattr(obj, "shared_mesh"):
+        decode_mesh(obj.shared_mesh)
+    if hasattr(obj, "skinned_mesh_renderer"):
+        decode_mesh(obj.skinned_mesh_renderer.mesh)
+    if hasattr(obj, "collider") and hasattr(obj.collider, "mesh"):
+        decode_mesh(obj.collider.mesh)
+    for child in obj.children:
+        decode_object(child)
+
+def count_objects(obj):
+    return 1 + sum(count_objects(child) for child in obj.children)
+
+decode_phases = [
+    ("read", lambda path: Mu().read(path)),
+    ("read_mmap", lambda path: Mu().read(path, use_mmap=True)),
+    ("read_lazy", lambda path: Mu().read(path, use_mmap=True, lazy=True)),
+    ("decode", lambda path: decode_object(Mu().read(path).obj)),
+]
+
+def decode_file(path, repeat):
+    record = file_record(path)
+    try:
+        for i in range(repeat):
+            phases = {}
+            memory = {}
+            tracemalloc.start()
+            for name, func in decode_phases:
+                tracemalloc.clear_traces()
+                if hasattr(tracemalloc, "reset_peak"):
+                    tracemalloc.reset_peak()
+                start = perf_counter()
+                func(path)
+                phases[name] = perf_counter() - start
+                memory[name] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            counts = {"objects": count_objects(Mu().read(path).obj)}
+            merge_run(record, sum(phases.values()), phases, memory, counts)
+    except Exception as e:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        record["error"] = "%s: %s" % (type(e).__name__, e)
+    return record
+
+def clear_data(collection):
+    # remove everything the import created so files don't affect each other
+    data = bpy.data
+    for obj in list(collection.all_objects):
+        data.objects.remove(obj)
+    data.collections.remove(collection)
+    for datablocks in [data.meshes, data.armatures, data.lights,
+                       data.cameras, data.actions, data.materials,
+                       data.images]:
+        for block in list(datablocks):
+            if not block.users:
+                datablocks.remove(block)
+
+def import_file(path, repeat, addon, use_cprofile):
+    import_mu = importlib.import_module(addon + ".import_mu")
+    cache = importlib.import_module(addon + ".import_mu.cache")
+    record = file_record(path)
+    try:
+        for i in range(repeat):
+            # every run starts cold
+            cache.clear_cache()
+            collection = bpy.data.collections.new(os.path.basename(path))
+            bpy.context.scene.collection.children.link(collection)
+            profile = import_mu.ImportProfile(use_cprofile=use_cprofile,
+                                              trace_memory=True)
+            try:
+                import_mu.import_mu(collection, path, True, False,
+                                    profile=profile)
+            finally:
+                clear_data(collection)
+            merge_run(record, profile.total, profile.phases, profile.memory,
+                      profile.counts)
+            if use_cprofile:
+                record["functions"] = profile.functions()
+    except Exception as e:
+        record["error"] = "%s: %s" % (type(e).__name__, e)
+    return record
+
+def write_csv(records, filepath):
+    with open(filepath, "wt", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["file", "size", "phase", "seconds", "peak_bytes"])
+        for r in records:
+            for name, elapsed in r["phases"].items():
+                writer.writerow([r["file"], r["size"], name, elapsed,
+                                 r["memory"].get(name, "")])
+            writer.writerow([r["file"], r["size"], "total", r["total"], ""])
+
+def print_records(records):
+    for r in records:
+        if r["error"]:
+            print("%s: %s" % (r["file"], r["error"]))
+            continue
+        print("%s: %.3fs" % (r["file"], r["total"]))
+        for name, elapsed in r["phases"].items():
+            peak = r["memory"].get(name)
+            if peak is not None:
+                print("    %-20s %9.3fs %10.1fMB" % (name, elapsed,
+                                                    peak / (1024 * 1024)))
+            else:
+                print("    %-20s %9.3fs" % (name, elapsed))
+    size = sum(r["size"] for r in records) / (1024 * 1024)
+    total = sum(r["total"] for r in records)
+    print("%d files, %.1fMB, %.3fs" % (len(records), size, total))
+
+def compare(old_path, new_path, threshold, min_time):
+    with open(old_path, "rt") as f:
+        old = {r["file"]: r for r in json.load(f)}
+    with open(new_path, "rt") as f:
+        new = json.load(f)
+    regressions = 0
+    for r in new:
+        if r["file"] not in old or r["error"]:
+            continue
+        o = old[r["file"]]
+        if o["error"]:
+            continue
+        phases = dict(r["phases"])
+        phases["total"] = r["total"]
+        old_phases = dict(o["phases"])
+        old_phases["total"] = o["total"]
+        for name, elapsed in phases.items():
+            if name not in old_phases:
+                continue
+            before = old_phases[name]
+            if (elapsed - before > min_time
+                and elapsed > before * (1 + threshold)):
+                regressions += 1
+                flag = "REGRESSION"
+            else:
+                flag = ""
+            ratio = elapsed / before if before else 0
+            print("%-40s %-20s %9.3fs %9.3fs %6.2fx %s"
+                  % (os.path.basename(r["file"]), name, before, elapsed,
+                     ratio, flag))
+    print("%d regressions" % regressions)
+    return regressions
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="benchmark .mu imports")
+    parser.add_argument("--decode", action="store_true",
+                        help="benchmark mu.py decoding only (no blender)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two --json results")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative slowdown flagged as a regression")
+    parser.add_argument("--min-time", type=float, default=0.005,
+                        help="ignore slowdowns smaller than this (seconds)")
+    parser.add_argument("--addon", default="io_object_mu",
+                        help="module name of the installed addon")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--cprofile", action="store_true",
+                        help="include the top functions (imports only)")
+    parser.add_argument("--json", metavar="FILE")
+    parser.add_argument("--csv", metavar="FILE")
+    parser.add_argument("paths", nargs="*")
+    return parser.parse_args(args)
+
+def main():
+    args = sys.argv[1:]
+    if "--" in sys.argv:
+        # running in blender: the script's arguments follow --
+        args = sys.argv[sys.argv.index("--") + 1:]
+    args = parse_args(args)
+    if args.compare:
+        return 1 if compare(args.compare[0], args.compare[1],
+                            args.threshold, args.min_time) else 0
+    files = find_files(args.paths)
+    if args.decode or not bpy:
+        records = [decode_file(f, args.repeat) for f in files]
+    else:
+        import addon_utils
+        addon_utils.enable(args.addon, default_set=True)
+        records = [import_file(f, args.repeat, args.addon, args.cprofile)
+                   for f in files]
+    print_records(records)
+    if args.json:
+        with open(args.json, "wt") as f:
+            json.dump(records, f, indent=1)
+    if args.csv:
+        write_csv(records, args.csv)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,30 +1,28 @@
-from mu import Mu
+from mu import Mu, MuRewrite
+from mubatch import batch_main
 import sys
 
-def check_obj(obj):
-    dirty = False
-    if hasattr(obj, "light"):
-        if obj.light.cullingMask != 0x828001:
-            obj.light.cullingMask = 0x828001
-            dirty = True
-    for child in obj.children:
-        dirty |= check_obj(child)
-    return dirty
+def fix_light(event, data):
+    if event == "component" and data[0] == "light":
+        light = data[1]
+        if light.cullingMask != 0x828001:
+            light.cullingMask = 0x828001
+            return MuRewrite.ENCODE
+    return MuRewrite.KEEP
 
 def find_lights(fname):
+    # only the lights are re-encoded, the rest of the file is copied as is
     mu = Mu()
-    if not mu.read(fname):
+    sys.stdout.write("checking " + fname)
+    fixed = mu.rewrite(fname, fix_light, fname+".new")
+    if fixed is None:
         print("could not read: " + fname)
         raise
-    sys.stdout.write("checking " + fname)
-    if check_obj(mu.obj):
-        mu.write(fname+".new")
+    if fixed:
         print(" fixed")
     else:
         print(" ok")
+    return fixed
 
-for f in sys.argv[1:]:
-    try:
-        find_lights(f)
-    except:
-        pass
+if __name__ == "__main__":
+    batch_main(find_lights, description="fix light culling masks")
@@ -19,7 +19,34 @@
 
 # <pep8 compliant>
 
-from struct import pack, unpack
+from array import array
+from io import BytesIO
+from itertools import chain
+from struct import Struct
+import mmap
+import os
+import sys
+
+# Struct objects for the primitive readers and writers, keyed by type code
+# and count, so the format is parsed only once
+struct_cache = {}
+
+def get_struct(code, count):
+    try:
+        return struct_cache[code, count]
+    except KeyError:
+        s = struct_cache[code, count] = Struct("<%d%s" % (count, code))
+        return s
+
+BYTE = get_struct("B", 1)
+INT = get_struct("i", 1)
+UINT = get_struct("I", 1)
+FLOAT = get_struct("f", 1)
+VECTOR = get_struct("f", 3)
+QUATERNION = get_struct("f", 4)
+TANGENT = QUATERNION
+KEY = Struct("<4fi")                # time, value, in, out tangents, mode
+BONE_WEIGHT = Struct("<" + "if" * 4)  # index, weight pairs
 
 class MuEnum:
     MODEL_BINARY = 76543
@@ -365,18 +392,16 @@ class MuKey:
         pass
     def read(self, mu):
         #print("MuKey")
-        self.time = mu.read_float()
-        self.value = mu.read_float()
-        self.tangent = mu.read_float(2) # in, out
-        self.tangentMode = mu.read_int()
+        return self._set(mu.read_struct(KEY))
+    def _set(self, data):
+        self.time, self.value, tin, tout, self.tangentMode = data
+        self.tangent = tin, tout # in, out
         # editable, smooth, linear, stepped (0..3?)
         #print("   ", self.time, self.value, self.tangent, self.tangentMode)
         return self
     def write(self, mu):
-        mu.write_float(self.time)
-        mu.write_float(self.value)
-        mu.write_float(self.tangent)
-        mu.write_int(self.tangentMode)
+        mu.write_struct(KEY, self.time, self.value,
+                        self.tangent[0], self.tangent[1], self.tangentMode)
 
 class MuCurve:
     def __init__(self):
@@ -402,9 +427,8 @@ class MuCurve:
         else:
             num_keys = mu.read_int()
         #print(num_keys)
-        self.keys = []
-        for i in range(num_keys):
-            self.keys.append(MuKey().read(mu))
+        data = mu.read_bytes(KEY.size * num_keys)
+        self.keys = [MuKey()._set(k) for k in KEY.iter_unpack(data)]
         return self
     def write(self, mu):
         mu.write_string(self.path)
@@ -463,26 +487,194 @@ class MuBoneWeight:
         self.indices = []
         self.weights = []
     def read(self, mu):
-        for i in range(4):
-            self.indices.append(mu.read_int())
-            self.weights.append(mu.read_float())
+        data = mu.read_struct(BONE_WEIGHT)
+        self.indices = list(data[0::2])
+        self.weights = list(data[1::2])
         return self
     def write(self, mu):
-        for i in range(4):
-            mu.write_int(self.indices[i])
-            mu.write_float(self.weights[i])
+        i, w = self.indices, self.weights
+        mu.write_struct(BONE_WEIGHT, i[0], w[0], i[1], w[1],
+                        i[2], w[2], i[3], w[3])
+
+# flips the sign bit of a little-endian float when used with bytes.translate
+_SIGN_FLIP = bytes(i ^ 0x80 for i in range(256))
+
+def _array_from_bytes(typecode, data):
+    a = array(typecode)
+    a.frombytes(data)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
+
+def _array_to_bytes(a):
+    if sys.byteorder == "big":
+        a = array(a.typecode, a)
+        a.byteswap()
+    return a.tobytes()
+
+def _swap_yz(a, stride):
+    #convert between Unity's LHS and Blender's RHS (works either direction)
+    a[1::stride], a[2::stride] = a[2::stride], a[1::stride]
+
+def _negate_w(data):
+    #negate the w component of little-endian xyzw floats by flipping the
+    #sign bit in the top byte of each w
+    data = bytearray(data)
+    data[15::16] = data[15::16].translate(_SIGN_FLIP)
+    return data
+
+def _group(a, width):
+    it = iter(a)
+    return list(zip(*[it] * width))
+
+def _float_array(data):
+    return _array_from_bytes("f", data)
+
+def _vector_array(data):
+    a = _array_from_bytes("f", data)
+    _swap_yz(a, 3)
+    return a
+
+def _tangent_array(data):
+    a = _array_from_bytes("f", _negate_w(data))
+    _swap_yz(a, 4)
+    return a
+
+def _int_array(data):
+    return _array_from_bytes("i", data)
+
+def _color_array(data):
+    return _array_from_bytes("B", data)
+
+def _triangle_array(data, rotated=None):
+    tris = _array_from_bytes("i", data)
+    #reverse the triangle winding for Blender (because of the
+    # LHS/RHS swap)
+    tris[0::3], tris[2::3] = tris[2::3], tris[0::3]
+    #avoid putting 0 at the end of the list (Blender doesn't
+    #like that): rotate those triangles to put 0 at the front
+    ends = tris[2::3].tolist()
+    i = -1
+    while True:
+        try:
+            i = ends.index(0, i + 1)
+        except ValueError:
+            break
+        t = i * 3
+        tris[t:t + 3] = array("i", (0, tris[t], tris[t + 1]))
+        if rotated is not None:
+            rotated.append(i)
+    return tris
+
+class _SubmeshArrays(list):
+    # The triangle arrays as converted from the file, along with the
+    # triangles _triangle_array rotated in each. These arrays are never
+    # handed out (MuMesh._submesh_arrays copies them), so MuMesh.write can
+    # undo the rotation and give back the triangles exactly as read.
+    def __init__(self):
+        super().__init__()
+        self.rotated = []
+    def append_raw(self, data):
+        rotated = array("i")
+        self.append(_triangle_array(data, rotated))
+        self.rotated.append(rotated)
+
+def _submesh_arrays(raws):
+    arrays = _SubmeshArrays()
+    for data in raws:
+        arrays.append_raw(data)
+    return arrays
+
+def _color_list(a):
+    return _group([c / 255.0 for c in a], 4)
+
+def _bone_weight_list(a):
+    #index, weight pairs: the weights are reinterpreted as floats
+    indices = a[0::2]
+    weights = array("f")
+    weights.frombytes(a[1::2].tobytes())
+    bws = [None] * (len(indices) // 4)
+    for i in range(len(bws)):
+        bw = MuBoneWeight()
+        bw.indices = list(indices[i * 4:i * 4 + 4])
+        bw.weights = list(weights[i * 4:i * 4 + 4])
+        bws[i] = bw
+    return bws
+
+def _submesh_list(a):
+    return [_group(tris, 3) for tris in a]
+
+class MuChannel:
+    """Mesh channel that may be held as raw file data or a flat array.
+
+    MuMesh.read keeps each channel's bytes as read from the file (a
+    memoryview into the file when memory mapped). The first time the array
+    is needed, the data is converted to Blender's RHS in one step. The list
+    of tuples view is built only when the attribute is first accessed, at
+    which point the list becomes the channel's data. Assigning the attribute
+    replaces any raw data or array.
+
+    typecode and width describe the array: width elements per record.
+    """
+    def __init__(self, name, typecode, width, make_array, make_list):
+        self.name = name
+        self.typecode = typecode
+        self.width = width
+        self.make_array = make_array
+        self.make_list = make_list
+    def __get__(self, mesh, owner=None):
+        if mesh is None:
+            return self
+        data = mesh.__dict__
+        if self.name not in data:
+            arr = self.array(mesh)
+            mesh._arrays.pop(self.name, None)
+            data[self.name] = self.make_list(arr) if arr is not None else []
+        return data[self.name]
+    def __set__(self, mesh, value):
+        mesh._raw.pop(self.name, None)
+        mesh._arrays.pop(self.name, None)
+        mesh.__dict__[self.name] = value
+    def array(self, mesh):
+        if self.name in mesh._raw:
+            raw = mesh._raw.pop(self.name)
+            mesh._arrays[self.name] = self.make_array(raw)
+        return mesh._arrays.get(self.name)
+    def count(self, mesh):
+        if self.name in mesh.__dict__:
+            return len(mesh.__dict__[self.name])
+        if self.name in mesh._raw:
+            raw = mesh._raw[self.name]
+            if type(raw) is list:
+                return len(raw)
+            return len(raw) // (self.width * array(self.typecode).itemsize)
+        if self.name in mesh._arrays:
+            return len(mesh._arrays[self.name]) // self.width
+        return 0
 
 class MuMesh:
+    verts = MuChannel("verts", "f", 3, _vector_array,
+                      lambda a: _group(a, 3))
+    uvs = MuChannel("uvs", "f", 2, _float_array, lambda a: _group(a, 2))
+    uv2s = MuChannel("uv2s", "f", 2, _float_array, lambda a: _group(a, 2))
+    normals = MuChannel("normals", "f", 3, _vector_array,
+                        lambda a: _group(a, 3))
+    tangents = MuChannel("tangents", "f", 4, _tangent_array,
+                         lambda a: _group(a, 4))
+    boneWeights = MuChannel("boneWeights", "i", 8, _int_array,
+                            _bone_weight_list)
+    # one record per submesh: a list of triangle arrays
+    submeshes = MuChannel("submeshes", "i", 1, _submesh_arrays,
+                          _submesh_list)
+    colors = MuChannel("colors", "B", 4, _color_array, _color_list)
     def __init__(self):
-        self.verts = []
-        self.uvs = []
-        self.uv2s = []
-        self.normals = []
-        self.tangents = []
-        self.boneWeights = []
+        self._raw = {}
+        self._arrays = {}
         self.bindPoses = []
-        self.submeshes = []
-        self.colors = []
+    def _set_raw(self, name, data):
+        self.__dict__.pop(name, None)
+        self._arrays.pop(name, None)
+        self._raw[name] = data
     def read(self, mu):
         #print("MuMesh")
         start = mu.read_int()
@@ -495,28 +687,22 @@ class MuMesh:
                 break
             elif type == MuEnum.ET_MESH_VERTS:
                 #print("    verts")
-                for i in range(num_verts):
-                    self.verts.append(mu.read_vector())
+                self._set_raw("verts", mu.read_bytes(12 * num_verts))
             elif type == MuEnum.ET_MESH_UV:
                 #print("    uvs")
-                for i in range(num_verts):
-                    self.uvs.append(mu.read_float(2))
+                self._set_raw("uvs", mu.read_bytes(8 * num_verts))
             elif type == MuEnum.ET_MESH_UV2:
                 #print("    uv2s")
-                for i in range(num_verts):
-                    self.uv2s.append(mu.read_float(2))
+                self._set_raw("uv2s", mu.read_bytes(8 * num_verts))
             elif type == MuEnum.ET_MESH_NORMALS:
                 #print("    normals")
-                for i in range(num_verts):
-                    self.normals.append(mu.read_vector())
+                self._set_raw("normals", mu.read_bytes(12 * num_verts))
             elif type == MuEnum.ET_MESH_TANGENTS:
                 #print("    tangents")
-                for i in range(num_verts):
-                    self.tangents.append(mu.read_tangent())
+                self._set_raw("tangents", mu.read_bytes(16 * num_verts))
             elif type == MuEnum.ET_MESH_BONE_WEIGHTS:
                 #print("    bone weights")
-                for i in range(num_verts):
-                    self.boneWeights.append(MuBoneWeight().read(mu))
+                self._set_raw("boneWeights", mu.read_bytes(32 * num_verts))
             elif type == MuEnum.ET_MESH_BIND_POSES:
                 #print("    bind poses")
                 num_poses = mu.read_int()
@@ -525,74 +711,155 @@ class MuMesh:
             elif type == MuEnum.ET_MESH_TRIANGLES:
                 #print("    sub mesh")
                 num_tris = mu.read_int()
-                tris = []
-                for i in range(int(num_tris / 3)):   #FIXME is this guaranteed?
-                    tri = mu.read_int(3)
-                    #reverse the triangle winding for Blender (because of the
-                    # LHS/RHS swap)
-                    #avoid putting 0 at the end of the list (Blender doesn't
-                    #like that)
-                    if not tri[0]:
-                        tri = tri[0], tri[2], tri[1]
-                    else:
-                        tri = tri[2], tri[1], tri[0]
-                    tris.append(tri)
-                self.submeshes.append(tris)
+                num_tris = int(num_tris / 3)    #FIXME is this guaranteed?
+                data = mu.read_bytes(12 * num_tris)
+                if "submeshes" in self.__dict__:
+                    self.submeshes.append(_group(_triangle_array(data), 3))
+                elif "submeshes" in self._arrays:
+                    self._arrays["submeshes"].append_raw(data)
+                else:
+                    self._raw.setdefault("submeshes", []).append(data)
             elif type == MuEnum.ET_MESH_VERTEX_COLORS:
-                for i in range(num_verts):
-                    colb = mu.read_byte(4)
-                    col = tuple(map (lambda c: c / 255.0, colb))
-                    self.colors.append(col)
+                self._set_raw("colors", mu.read_bytes(4 * num_verts))
             else:
                 raise ValueError("MuMesh %x %d" % (mu.file.tell(), type))
         return self
+    def _count(self, name):
+        return getattr(MuMesh, name).count(self)
+    def _array(self, name):
+        if name in self.__dict__:
+            return None
+        return getattr(MuMesh, name).array(self)
+    def _float_channel(self, name):
+        # always a fresh array: the caller is free to swizzle it in place
+        arr = self._array(name)
+        if arr is not None:
+            return array("f", arr)
+        return array("f", chain.from_iterable(getattr(self, name)))
+    def _color_bytes(self):
+        arr = self._array("colors")
+        if arr is not None:
+            return arr.tobytes()
+        return bytes([int(bound(0, x, 1) * 255)
+                      for c in self.colors for x in c])
+    def _bone_weight_ints(self):
+        arr = self._array("boneWeights")
+        if arr is not None:
+            return arr
+        indices = array("i")
+        weights = array("f")
+        for bw in self.boneWeights:
+            # exactly 4 per vertex, or every later vertex would be shifted:
+            # short entries are padded with index 0, weight 0 (as the
+            # exporter pads them)
+            i = bw.indices[:4]
+            w = bw.weights[:4]
+            indices.extend(i)
+            indices.extend((0,) * (4 - len(i)))
+            weights.extend(w)
+            weights.extend((0.0,) * (4 - len(w)))
+        data = array("i", bytes(8 * len(indices)))
+        data[0::2] = indices
+        # the weights are stored as floats: copy their bits
+        data[1::2] = array("i", weights.tobytes())
+        return data
+    def _submesh_arrays(self):
+        arr = self._array("submeshes")
+        if arr is not None:
+            return [array("i", tris) for tris in arr]
+        return [array("i", chain.from_iterable(tri[:3] for tri in sm))
+                for sm in self.submeshes]
     def write(self, mu):
+        num_verts = self._count("verts")
         mu.write_int(MuEnum.ET_MESH_START)
-        mu.write_int(len(self.verts))
-        mu.write_int(len(self.submeshes))
+        mu.write_int(num_verts)
+        mu.write_int(self._count("submeshes"))
 
         mu.write_int(MuEnum.ET_MESH_VERTS)
-        for v in self.verts:
-            mu.write_vector(v)
-        if len(self.uvs) == len(self.verts):
+        verts = self._float_channel("verts")
+        _swap_yz(verts, 3)
+        mu.write_array(verts)
+        if self._count("uvs") == num_verts:
             mu.write_int(MuEnum.ET_MESH_UV)
-            for uv in self.uvs:
-                mu.write_float(uv)
-        if len(self.uv2s) == len(self.verts):
+            mu.write_array(self._float_channel("uvs"))
+        if self._count("uv2s") == num_verts:
             mu.write_int(MuEnum.ET_MESH_UV2)
-            for uv in self.uv2s:
-                mu.write_float(uv)
-        if len(self.normals) == len(self.verts):
+            mu.write_array(self._float_channel("uv2s"))
+        if self._count("normals") == num_verts:
             mu.write_int(MuEnum.ET_MESH_NORMALS)
-            for n in self.normals:
-                mu.write_vector(n)
-        if len(self.tangents) == len(self.verts):
+            normals = self._float_channel("normals")
+            _swap_yz(normals, 3)
+            mu.write_array(normals)
+        if self._count("tangents") == num_verts:
             mu.write_int(MuEnum.ET_MESH_TANGENTS)
-            for t in self.tangents:
-                mu.write_tangent(t)
-        if len(self.boneWeights) == len(self.verts):
+            tangents = self._float_channel("tangents")
+            _swap_yz(tangents, 4)
+            mu.write_bytes(_negate_w(_array_to_bytes(tangents)))
+        if self._count("boneWeights") == num_verts:
             mu.write_int(MuEnum.ET_MESH_BONE_WEIGHTS)
-            for bw in self.boneWeights:
-                bw.write(mu)
+            mu.write_array(self._bone_weight_ints())
         if len(self.bindPoses):
             mu.write_int(MuEnum.ET_MESH_BIND_POSES)
             mu.write_int(len(self.bindPoses))
-            for bp in self.bindPoses:
-                mu.write_float(bp)
-        if len(self.colors) == len(self.verts):
+            mu.write_array(array("f", chain.from_iterable(self.bindPoses)))
+        if self._count("colors") == num_verts:
             mu.write_int(MuEnum.ET_MESH_VERTEX_COLORS)
-            for t in self.colors:
-                mu.write_color(t)
-        for sm in self.submeshes:
+            mu.write_bytes(self._color_bytes())
+        arrays = self._array("submeshes")
+        rotated = arrays.rotated if arrays is not None else []
+        for i, tris in enumerate(self._submesh_arrays()):
             mu.write_int(MuEnum.ET_MESH_TRIANGLES)
-            mu.write_int(len(sm) * 3)
-            for tri in sm:
+            mu.write_int(len(tris))
+            if i < len(rotated):
+                # untouched since read: put back the triangles the reader
+                # rotated and undo its swap, for the file's exact triangles
+                for t in rotated[i]:
+                    t *= 3
+                    tris[t:t + 3] = array("i", (tris[t + 1], tris[t + 2],
+                                                tris[t]))
+                tris[0::3], tris[2::3] = tris[2::3], tris[0::3]
+            else:
                 #reverse the triangle winding for Blender (because of the
                 # LHS/RHS swap)
-                tri = tri[0], tri[2], tri[1]
-                mu.write_int(tri)
+                tris[1::3], tris[2::3] = tris[2::3], tris[1::3]
+            mu.write_array(tris)
         mu.write_int(MuEnum.ET_MESH_END)
 
+def raw_channel(mesh, name):
+    """Zero-copy view of a mesh channel's data as read from the file.
+
+    The view is in the file's layout (little-endian, Unity's LHS, original
+    triangle winding) and cast to the channel's element type. Returns None
+    once the channel has been converted or assigned. For submeshes, a list
+    of views is returned.
+    """
+    if name not in mesh._raw:
+        return None
+    typecode = getattr(MuMesh, name).typecode
+    raw = mesh._raw[name]
+    if type(raw) is list:
+        return [memoryview(r).cast("B").cast(typecode) for r in raw]
+    return memoryview(raw).cast("B").cast(typecode)
+
+def channel_array(mesh, name):
+    """Flat array of a mesh channel, converted to Blender's RHS.
+
+    When the channel hasn't been accessed as a list, this is the mesh's own
+    array and must not be modified. Submeshes are returned as a list of
+    triangle arrays (always copies), and bone weights as interleaved
+    index/weight-bits ints, as in the file.
+    """
+    if name == "submeshes":
+        return mesh._submesh_arrays()
+    if name == "boneWeights":
+        return mesh._bone_weight_ints()
+    if name == "colors":
+        return array("B", mesh._color_bytes())
+    arr = mesh._array(name)
+    if arr is None:
+        arr = array("f", chain.from_iterable(getattr(mesh, name)))
+    return arr
+
 class MuRenderer:
     def __init__(self):
         self.castShadows = 1
@@ -913,11 +1180,155 @@ class MuLight:
         mu.write_uint(self.cullingMask)
         mu.write_float(self.spotAngle)
 
+def skip_string(mu):
+    mu.skip(mu.read_7int())
+
+def skip_mesh(mu):
+    start = mu.read_int()
+    if start != MuEnum.ET_MESH_START:
+        raise
+    num_verts, submesh_count = mu.read_int(2)
+    while True:
+        type = mu.read_int()
+        if type == MuEnum.ET_MESH_END:
+            break
+        elif type == MuEnum.ET_MESH_BIND_POSES:
+            mu.skip(64 * mu.read_int())
+        elif type == MuEnum.ET_MESH_TRIANGLES:
+            mu.skip(12 * int(mu.read_int() / 3))
+        elif type in mesh_record_sizes:
+            mu.skip(mesh_record_sizes[type] * num_verts)
+        else:
+            raise ValueError("MuMesh %x %d" % (mu.file.tell(), type))
+
+mesh_record_sizes = {
+    MuEnum.ET_MESH_VERTS: 12,
+    MuEnum.ET_MESH_UV: 8,
+    MuEnum.ET_MESH_UV2: 8,
+    MuEnum.ET_MESH_NORMALS: 12,
+    MuEnum.ET_MESH_TANGENTS: 16,
+    MuEnum.ET_MESH_BONE_WEIGHTS: 32,
+    MuEnum.ET_MESH_VERTEX_COLORS: 4,
+}
+
+def skip_mesh_filter(mu, entry_type):
+    skip_mesh(mu)
+
+def skip_mesh_collider(mu, entry_type):
+    if entry_type == MuEnum.ET_MESH_COLLIDER2:
+        mu.skip(1)  # isTrigger
+    mu.skip(1)      # convex
+    skip_mesh(mu)
+
+def skip_skinned_mesh_renderer(mu, entry_type):
+    mu.skip(4 * mu.read_int())      # materials
+    mu.skip(12 + 12 + 4 + 1)        # center, size, quality, updateWhenOffscreen
+    for i in range(mu.read_int()):
+        skip_string(mu)             # bones
+    skip_mesh(mu)
+
+def skip_animation(mu, entry_type):
+    for i in range(mu.read_int()):
+        skip_string(mu)             # clip name
+        mu.skip(12 + 12 + 4)        # lbCenter, lbSize, wrapMode
+        for j in range(mu.read_int()):
+            skip_string(mu)         # path
+            skip_string(mu)         # property
+            type = mu.read_int()
+            wrapMode = mu.read_int(2)
+            if type == 8:
+                # bad PartTools export, see MuCurve.read
+                num_keys = wrapMode[1]
+            else:
+                num_keys = mu.read_int()
+            mu.skip(20 * num_keys)  # MuKey: 4 floats and an int
+    skip_string(mu)                 # clip
+    mu.skip(1)                      # autoPlay
+
+def skip_particles(mu, entry_type):
+    mu.skip(290)                    # fixed size, see MuParticles.read
+
+# the MuObject attribute each component entry type is read into
+component_attributes = {
+    MuEnum.ET_TAG_AND_LAYER: "tag_and_layer",
+    MuEnum.ET_MESH_COLLIDER: "collider",
+    MuEnum.ET_SPHERE_COLLIDER: "collider",
+    MuEnum.ET_CAPSULE_COLLIDER: "collider",
+    MuEnum.ET_BOX_COLLIDER: "collider",
+    MuEnum.ET_MESH_COLLIDER2: "collider",
+    MuEnum.ET_SPHERE_COLLIDER2: "collider",
+    MuEnum.ET_CAPSULE_COLLIDER2: "collider",
+    MuEnum.ET_BOX_COLLIDER2: "collider",
+    MuEnum.ET_WHEEL_COLLIDER: "collider",
+    MuEnum.ET_MESH_FILTER: "shared_mesh",
+    MuEnum.ET_MESH_RENDERER: "renderer",
+    MuEnum.ET_SKINNED_MESH_RENDERER: "skinned_mesh_renderer",
+    MuEnum.ET_ANIMATION: "animation",
+    MuEnum.ET_CAMERA: "camera",
+    MuEnum.ET_PARTICLES: "particles",
+    MuEnum.ET_LIGHT: "light",
+}
+
+# entry types a lazy read skips over: the MuObject attribute the component
+# will be loaded into, and the function that skips the component's data
+lazy_entries = {
+    MuEnum.ET_MESH_COLLIDER: ("collider", skip_mesh_collider),
+    MuEnum.ET_MESH_COLLIDER2: ("collider", skip_mesh_collider),
+    MuEnum.ET_MESH_FILTER: ("shared_mesh", skip_mesh_filter),
+    MuEnum.ET_SKINNED_MESH_RENDERER: ("skinned_mesh_renderer",
+                                      skip_skinned_mesh_renderer),
+    MuEnum.ET_ANIMATION: ("animation", skip_animation),
+    MuEnum.ET_PARTICLES: ("particles", skip_particles),
+}
+
+class MuLazyComponent:
+    """Placeholder for a component skipped by a lazy read.
+
+    The component is read from the recorded file offset the first time it
+    is loaded.
+    """
+    def __init__(self, reader, entry_type, offset):
+        self.reader = reader
+        self.entry_type = entry_type
+        self.offset = offset
+        self.component = None
+    def load(self):
+        if self.component is None:
+            file = self.reader.file
+            pos = file.tell()
+            file.seek(self.offset)
+            obj = MuObject()
+            obj._read_entry(self.reader, self.entry_type)
+            file.seek(pos)
+            self.component = obj.components[0]
+        return self.component
+
 class MuObject:
     def __init__(self, name=""):
         self.name = name
         self.children = []
         self.components = []
+        self._lazy = {}
+    def __getattr__(self, name):
+        # components skipped by a lazy read are loaded on first access
+        lazy = self.__dict__.get("_lazy")
+        if lazy and name in lazy:
+            component = lazy.pop(name).load()
+            setattr(self, name, component)
+            return component
+        raise AttributeError(name)
+    def __dir__(self):
+        return list(object.__dir__(self)) + list(self._lazy)
+    @property
+    def components(self):
+        components = self._components
+        for i, c in enumerate(components):
+            if isinstance(c, MuLazyComponent):
+                components[i] = c.load()
+        return components
+    @components.setter
+    def components(self, components):
+        self._components = components
     def read(self, mu):
         #print("MuObject")
         self.transform = MuTransform().read(mu)
@@ -927,57 +1338,68 @@ class MuObject:
             except EOFError:
                 break
             #print(entry_type, hex(mu.file.tell()))
-            if entry_type == MuEnum.ET_CHILD_TRANSFORM_START:
-                self.children.append(MuObject().read(mu))
-            elif entry_type == MuEnum.ET_CHILD_TRANSFORM_END:
+            if not self._read_entry(mu, entry_type):
                 break
-            elif entry_type == MuEnum.ET_TAG_AND_LAYER:
-                self.tag_and_layer = MuTagLayer().read(mu)
-            elif entry_type in [MuEnum.ET_MESH_COLLIDER,
-                                MuEnum.ET_SPHERE_COLLIDER,
-                                MuEnum.ET_CAPSULE_COLLIDER,
-                                MuEnum.ET_BOX_COLLIDER,
-                                MuEnum.ET_MESH_COLLIDER2,
-                                MuEnum.ET_SPHERE_COLLIDER2,
-                                MuEnum.ET_CAPSULE_COLLIDER2,
-                                MuEnum.ET_BOX_COLLIDER2,
-                                MuEnum.ET_WHEEL_COLLIDER]:
-                self.collider = MuCollider(entry_type).read(mu)
-                self.components.append(self.collider)
-            elif entry_type == MuEnum.ET_MESH_FILTER:
-                self.shared_mesh = MuMesh().read(mu)
-                self.components.append(self.shared_mesh)
-            elif entry_type == MuEnum.ET_MESH_RENDERER:
-                self.renderer = MuRenderer().read(mu)
-                self.components.append(self.renderer)
-            elif entry_type == MuEnum.ET_SKINNED_MESH_RENDERER:
-                self.skinned_mesh_renderer = MuSkinnedMeshRenderer().read(mu)
-                self.components.append(self.skinned_mesh_renderer)
-            elif entry_type == MuEnum.ET_ANIMATION:
-                self.animation = MuAnimation().read(mu)
-                self.components.append(self.animation)
-            elif entry_type == MuEnum.ET_CAMERA:
-                self.camera = MuCamera().read(mu)
-                self.components.append(self.camera)
-            elif entry_type == MuEnum.ET_PARTICLES:
-                self.particles = MuParticles().read(mu)
-                self.components.append(self.particles)
-            elif entry_type == MuEnum.ET_LIGHT:
-                self.light = MuLight().read(mu)
-                self.components.append(self.light)
-            elif entry_type == MuEnum.ET_MATERIALS:
-                mat_count = mu.read_int()
-                for i in range(mat_count):
-                    mat = MuMaterial().read(mu)
-                    mu.materials.append(mat)
-            elif entry_type == MuEnum.ET_TEXTURES:
-                tex_count = mu.read_int()
-                for i in range(tex_count):
-                    mu.textures.append(MuTexture().read(mu))
-            else:
-                #print(entry_type, hex(mu.file.tell()))
-                pass
         return self
+    def _read_entry(self, mu, entry_type):
+        if mu.lazy and entry_type in lazy_entries:
+            attr, skip = lazy_entries[entry_type]
+            component = MuLazyComponent(mu.lazy, entry_type, mu.file.tell())
+            skip(mu, entry_type)
+            self.__dict__.pop(attr, None)
+            self._lazy[attr] = component
+            self._components.append(component)
+        elif entry_type == MuEnum.ET_CHILD_TRANSFORM_START:
+            self.children.append(MuObject().read(mu))
+        elif entry_type == MuEnum.ET_CHILD_TRANSFORM_END:
+            return False
+        elif entry_type == MuEnum.ET_TAG_AND_LAYER:
+            self.tag_and_layer = MuTagLayer().read(mu)
+        elif entry_type in [MuEnum.ET_MESH_COLLIDER,
+                            MuEnum.ET_SPHERE_COLLIDER,
+                            MuEnum.ET_CAPSULE_COLLIDER,
+                            MuEnum.ET_BOX_COLLIDER,
+                            MuEnum.ET_MESH_COLLIDER2,
+                            MuEnum.ET_SPHERE_COLLIDER2,
+                            MuEnum.ET_CAPSULE_COLLIDER2,
+                            MuEnum.ET_BOX_COLLIDER2,
+                            MuEnum.ET_WHEEL_COLLIDER]:
+            self.collider = MuCollider(entry_type).read(mu)
+            self.components.append(self.collider)
+        elif entry_type == MuEnum.ET_MESH_FILTER:
+            self.shared_mesh = MuMesh().read(mu)
+            self.components.append(self.shared_mesh)
+        elif entry_type == MuEnum.ET_MESH_RENDERER:
+            self.renderer = MuRenderer().read(mu)
+            self.components.append(self.renderer)
+        elif entry_type == MuEnum.ET_SKINNED_MESH_RENDERER:
+            self.skinned_mesh_renderer = MuSkinnedMeshRenderer().read(mu)
+            self.components.append(self.skinned_mesh_renderer)
+        elif entry_type == MuEnum.ET_ANIMATION:
+            self.animation = MuAnimation().read(mu)
+            self.components.append(self.animation)
+        elif entry_type == MuEnum.ET_CAMERA:
+            self.camera = MuCamera().read(mu)
+            self.components.append(self.camera)
+        elif entry_type == MuEnum.ET_PARTICLES:
+            self.particles = MuParticles().read(mu)
+            self.components.append(self.particles)
+        elif entry_type == MuEnum.ET_LIGHT:
+            self.light = MuLight().read(mu)
+            self.components.append(self.light)
+        elif entry_type == MuEnum.ET_MATERIALS:
+            mat_count = mu.read_int()
+            for i in range(mat_count):
+                mat = MuMaterial().read(mu)
+                mu.materials.append(mat)
+        elif entry_type == MuEnum.ET_TEXTURES:
+            tex_count = mu.read_int()
+            for i in range(tex_count):
+                mu.textures.append(MuTexture().read(mu))
+        else:
+            #print(entry_type, hex(mu.file.tell()))
+            pass
+        return True
     def write(self, mu):
         self.transform.write(mu)
         self.tag_and_layer.write(mu)
@@ -994,6 +1416,9 @@ class MuObject:
             self.animation.write(mu)
         if hasattr(self, "camera") and self.camera != None:
             self.camera.write(mu)
+        if hasattr(self, "particles") and self.particles != None:
+            mu.write_int(MuEnum.ET_PARTICLES)
+            self.particles.write(mu)
         if hasattr(self, "light") and self.light != None:
             self.light.write(mu)
         for child in self.children:
@@ -1008,84 +1433,192 @@ def bound(mi, x, ma):
         return ma
     return x
 
+def encode_7int(val):
+    if val < 0:
+        val += 1 << 32
+    val &= (1 << 32) - 1
+    if val < 128:
+        return bytes((val,))
+    data = bytearray()
+    while val > 127:
+        data.append((val & 127) + 128)
+        val >>= 7
+    data.append(val)
+    return bytes(data)
+
+def decode_7int(data, pos=0):
+    # the 7-bit encoded int at data[pos] and the position after it. The
+    # value is None if data ends before the int does
+    val = 0
+    shift = 0
+    end = len(data)
+    while pos < end:
+        valb = data[pos]
+        pos += 1
+        val |= (valb & 127) << shift
+        if valb < 128:
+            return val, pos
+        shift += 7
+    return None, pos
+
+def read_file_7int(file):
+    # one read covers the longest int (5 bytes for 32 bits): the int is
+    # decoded from that, and the file is put back after its last byte
+    data = file.read(5)
+    val, size = decode_7int(data)
+    if val is None:
+        raise EOFError
+    if size < len(data):
+        file.seek(size - len(data), 1)
+    return val
+
+class MuMapFile:
+    """Read-only memory mapped file with a file-like cursor.
+
+    read() returns zero-copy memoryview slices of the file, and read_struct()
+    and read_7int() decode directly from the mapping.
+    """
+    def __init__(self, filepath):
+        with open(filepath, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size:
+                self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                # empty files can't be mapped
+                self.map = b""
+        self.view = memoryview(self.map)
+        self.size = len(self.view)
+        self.pos = 0
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence=0):
+        if whence == 1:
+            pos += self.pos
+        elif whence == 2:
+            pos += self.size
+        self.pos = pos
+
+    def read(self, size=-1):
+        if size < 0:
+            size = self.size - self.pos
+        data = self.view[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+    def read_struct(self, st):
+        pos = self.pos
+        if pos + st.size > self.size:
+            raise EOFError
+        self.pos = pos + st.size
+        return st.unpack_from(self.view, pos)
+
+    def read_7int(self):
+        val, pos = decode_7int(self.view, self.pos)
+        if val is None:
+            raise EOFError
+        self.pos = pos
+        return val
+
+class MuRewrite:
+    # actions returned by the Mu.rewrite patch callback
+    KEEP = 0
+    ENCODE = 1
+    DROP = 2
+
+def rewrite_component(mu, data):
+    attr, component = data
+    if isinstance(component, MuLazyComponent):
+        component = component.load()
+    # these two don't write their own entry type
+    if attr == "shared_mesh":
+        mu.write_int(MuEnum.ET_MESH_FILTER)
+    elif attr == "particles":
+        mu.write_int(MuEnum.ET_PARTICLES)
+    component.write(mu)
+
+def rewrite_materials(mu, materials):
+    mu.write_int(MuEnum.ET_MATERIALS)
+    mu.write_int(len(materials))
+    for mat in materials:
+        mat.write(mu)
+
+def rewrite_textures(mu, textures):
+    mu.write_int(MuEnum.ET_TEXTURES)
+    mu.write_int(len(textures))
+    for tex in textures:
+        tex.write(mu)
+
+rewrite_encoders = {
+    "transform": lambda mu, transform: transform.write(mu),
+    "component": rewrite_component,
+    "child_start":
+        lambda mu, data: mu.write_int(MuEnum.ET_CHILD_TRANSFORM_START),
+    "child_end": lambda mu, data: mu.write_int(MuEnum.ET_CHILD_TRANSFORM_END),
+    "materials": rewrite_materials,
+    "textures": rewrite_textures,
+}
+
+rewrite_droppable = {"component", "materials", "textures"}
+
 class Mu:
 
-    def read_byte(self, count=1, force_list=False):
-        size = 1 * count
-        data = self.file.read(size)
-        if len(data) < size:
+    def read_struct(self, st):
+        data = self.file.read(st.size)
+        if len(data) < st.size:
             raise EOFError
-        data = unpack("<%dB" % count, data)
+        return st.unpack(data)
+
+    def read_byte(self, count=1, force_list=False):
         if count == 1 and not force_list:
-            return data[0]
-        return data
+            return self.read_struct(BYTE)[0]
+        return self.read_struct(get_struct("B", count))
 
     def read_int(self, count=1, force_list=False):
-        size = 4 * count
-        data = self.file.read(size)
-        if len(data) < size:
-            raise EOFError
-        data = unpack("<%di" % count, data)
         if count == 1 and not force_list:
-            return data[0]
-        return data
+            return self.read_struct(INT)[0]
+        return self.read_struct(get_struct("i", count))
 
     def read_7int(self, count=1, force_list=False):
-        def readval():
-            val = 0
-            mult = 1
-            while True:
-                valb = self.read_byte()
-                val += (valb & 127) * mult
-                if valb < 128:
-                    break
-                mult *= 128
-            return val
+        # decoded straight from the mapped file, or from one read of the
+        # longest int: no struct or per-byte reads needed
+        file = self.file
+        mapped = type(file) is MuMapFile
         if count == 1 and not force_list:
-            return readval()
+            if mapped:
+                return file.read_7int()
+            return read_file_7int(file)
         vals = [None] * count
         for i in range(count):
-            vals[i] = readval()
+            vals[i] = file.read_7int() if mapped else read_file_7int(file)
         return vals
 
     def read_uint(self, count=1, force_list=False):
-        size = 4 * count
-        data = self.file.read(size)
-        if len(data) < size:
-            raise EOFError
-        data = unpack("<%dI" % count, data)
         if count == 1 and not force_list:
-            return data[0]
-        return data
+            return self.read_struct(UINT)[0]
+        return self.read_struct(get_struct("I", count))
 
     def read_float(self, count=1, force_list=False):
-        size = 4 * count
-        data = self.file.read(size)
-        if len(data) < size:
-            raise EOFError
-        data = unpack("<%df" % count, data)
         if count == 1 and not force_list:
-            return data[0]
-        return data
+            return self.read_struct(FLOAT)[0]
+        return self.read_struct(get_struct("f", count))
 
     def read_vector(self):
-        v = self.read_float(3)
+        x, y, z = self.read_struct(VECTOR)
         #convert from Unity's LHS to Blender's RHS
-        v = v[0], v[2], v[1]
-        return v
+        return x, z, y
 
     def read_quaternion(self):
-        q = self.read_float(4)
+        x, y, z, w = self.read_struct(QUATERNION)
         # Unity is xyzw, blender is wxyz. However, Unity is left-handed and
         # blender is right handed. To convert between LH and RH (either
         # direction), just swap y and z and reverse the rotation direction.
-        q = q[3], -q[0], -q[2], -q[1]
-        return q
+        return w, -x, -z, -y
 
     def read_tangent(self):
-        t = self.read_float(4)
-        t = t[0], t[2], t[1], -t[3]
-        return t
+        x, y, z, w = self.read_struct(TANGENT)
+        return x, z, y, -w
 
     def read_bytes(self, size):
         data = self.file.read(size)
@@ -1093,6 +1626,9 @@ class Mu:
             raise EOFError
         return data
 
+    def skip(self, size):
+        self.file.seek(size, 1)
+
     def read_string(self):
         size = self.read_7int()
         data = self.file.read(size)
@@ -1100,65 +1636,65 @@ class Mu:
             raise EOFError
         if type(data) == type(""):
             return data
-        s = ""
-        for c in data:
-            s = s + chr(c)
-        return s
+        # Unity writes UTF-8, but older exports may have written latin-1
+        try:
+            return str(data, "utf-8")
+        except UnicodeDecodeError:
+            return str(data, "latin-1")
 
     def write_byte(self, data):
         if not hasattr(data, "__len__"):
-            data = (data,)
-        self.file.write(pack(("<%dB" % len(data)), *data))
+            self.file.write(BYTE.pack(data))
+        else:
+            self.file.write(get_struct("B", len(data)).pack(*data))
 
     def write_int(self, data):
         if not hasattr(data, "__len__"):
-            data = (data,)
-        self.file.write(pack(("<%di" % len(data)), *data))
+            self.file.write(INT.pack(data))
+        else:
+            self.file.write(get_struct("i", len(data)).pack(*data))
 
     def write_7int(self, data):
-        def writeval(val):
-            if val < 0:
-                val += 1 << 32
-            val &= (1 << 32) - 1
-            while val > 127:
-                self.write_byte((val & 127) + 128)
-                val >>= 7
-            self.write_byte(val)
         if not hasattr(data, "__len__"):
-            data = (data,)
-        for d in data:
-            writeval(d)
+            self.file.write(encode_7int(data))
+        else:
+            self.file.write(b"".join(map(encode_7int, data)))
 
     def write_uint(self, data):
         if not hasattr(data, "__len__"):
-            data = (data,)
-        self.file.write(pack(("<%dI" % len(data)), *data))
+            self.file.write(UINT.pack(data))
+        else:
+            self.file.write(get_struct("I", len(data)).pack(*data))
 
     def write_float(self, data):
         if not hasattr(data, "__len__"):
-            data = (data,)
-        self.file.write(pack(("<%df" % len(data)), *data))
+            self.file.write(FLOAT.pack(data))
+        else:
+            self.file.write(get_struct("f", len(data)).pack(*data))
+
+    def write_struct(self, st, *data):
+        self.file.write(st.pack(*data))
 
     def write_vector(self, v):
         #convert from Blender's RHS to Unity's LHS
-        v = v[0], v[2], v[1]
-        self.write_float(v)
+        self.file.write(VECTOR.pack(v[0], v[2], v[1]))
 
     def write_quaternion(self, q):
         # Unity is xyzw, blender is wxyz. However, Unity is left-handed and
         # blender is right handed. To convert between LH and RH (either
         # direction), just swap y and z and reverse the rotation direction.
-        q = -q[1], -q[3], -q[2], q[0]
-        self.write_float(q)
+        self.file.write(QUATERNION.pack(-q[1], -q[3], -q[2], q[0]))
 
     def write_tangent(self, t):
-        t = t[0], t[2], t[1], -t[3]
-        self.write_float(t)
+        self.file.write(TANGENT.pack(t[0], t[2], t[1], -t[3]))
 
     def write_color(self, c):
         cb = tuple(map(lambda x: int(bound(0, x, 1) * 255), c))
         self.write_byte(cb)
 
+    def write_array(self, data):
+        self.file.write(_array_to_bytes(data))
+
     def write_bytes(self, data, size=-1):
         if size == -1:
             size = len(data)
@@ -1168,45 +1704,246 @@ class Mu:
 
     def write_string(self, data, size=-1):
         data = data.encode()
-        size = len(data)
-        self.write_7int(size)
-        self.write_bytes(data, size)
+        self.file.write(encode_7int(len(data)) + data)
 
     def __init__(self, name = "mu"):
         self.name = name
+        self.lazy = None
         pass
-    def read(self, filepath):
+    def read(self, filepath, use_mmap=False, lazy=False):
+        """Read the .mu file at filepath.
+
+        With use_mmap, the file is memory mapped instead of read: mesh
+        channel data then stays in the mapping (see raw_channel) until it is
+        used.
+
+        With lazy, meshes, animations and particles are skipped and their
+        offsets recorded (see lazy_entries). Each is read when its MuObject
+        attribute (or the object's components) is first accessed, so the file
+        is kept open by self.lazy until all references to it are gone.
+        """
         self.materials = []
         self.textures = []
-        self.file = open(filepath, "rb")
-        self.magic, self.version = self.read_int(2)
-        if (self.magic != MuEnum.MODEL_BINARY or self.version < 0
-            or self.version > MuEnum.FILE_VERSION):
+        if not self._open(filepath, use_mmap, lazy):
             return None
-        self.name = self.read_string()
         #print("version: %d '%s'" % (self.version, self.name))
         self.obj = MuObject().read(self)
         #self.read_materials()
         #self.read_textures()
-        del self.file
+        self._close()
         return self
-    def write(self, filepath):
-        self.file = open(filepath, "wb")
-        self.write_int(MuEnum.MODEL_BINARY)
-        self.write_int(MuEnum.FILE_VERSION)
-        self.write_string(self.name)
-        self.obj.write(self)
-        if len(self.materials):
-            self.write_int(MuEnum.ET_MATERIALS)
-            self.write_int(len(self.materials))
-            for mat in self.materials:
-                mat.write(self)
-        if len(self.textures):
-            self.write_int(MuEnum.ET_TEXTURES)
-            self.write_int(len(self.textures))
-            for tex in self.textures:
-                tex.write(self)
+    def stream(self, filepath, use_mmap=True, lazy=True):
+        """Read the .mu file at filepath as a stream of events.
+
+        A generator yielding (event, data) pairs in file order, so a model
+        can be processed in one forward pass without building the MuObject
+        tree:
+            ("transform", MuTransform) starts an object (the root included)
+            ("component", (attribute, component)) for each of the object's
+                components, including its tag and layer. attribute is the
+                MuObject attribute the component would have been read into.
+            ("child_start", None) and ("child_end", None) bracket children
+            ("materials", [MuMaterial]) and ("textures", [MuTexture])
+        The name and version are set before the first event. With lazy (the
+        default), skipped components (see lazy_entries) are MuLazyComponent
+        placeholders whose load() reads the component. Nothing is kept
+        once an event has been handled. Nothing is yielded if filepath is
+        not a .mu file.
+        """
+        if not self._open(filepath, use_mmap, lazy):
+            return
+        try:
+            for event, data, start, end in self._sections():
+                yield event, data
+        finally:
+            self._close()
+
+    def _sections(self):
+        # the stream events with the byte range each was read from
+        file = self.file
+        start = file.tell()
+        transform = MuTransform().read(self)
+        yield "transform", transform, start, file.tell()
+        depth = 0
+        while True:
+            start = file.tell()
+            try:
+                entry_type = self.read_int()
+            except EOFError:
+                break
+            if entry_type == MuEnum.ET_CHILD_TRANSFORM_START:
+                depth += 1
+                yield "child_start", None, start, file.tell()
+                start = file.tell()
+                transform = MuTransform().read(self)
+                yield "transform", transform, start, file.tell()
+            elif entry_type == MuEnum.ET_CHILD_TRANSFORM_END:
+                if not depth:
+                    break
+                depth -= 1
+                yield "child_end", None, start, file.tell()
+            elif entry_type == MuEnum.ET_MATERIALS:
+                mat_count = self.read_int()
+                materials = [MuMaterial().read(self) for i in range(mat_count)]
+                yield "materials", materials, start, file.tell()
+            elif entry_type == MuEnum.ET_TEXTURES:
+                tex_count = self.read_int()
+                textures = [MuTexture().read(self) for i in range(tex_count)]
+                yield "textures", textures, start, file.tell()
+            elif entry_type in component_attributes:
+                attr = component_attributes[entry_type]
+                obj = MuObject()
+                obj._read_entry(self, entry_type)
+                if attr in obj._lazy:
+                    component = obj._lazy[attr]
+                else:
+                    component = getattr(obj, attr)
+                yield "component", (attr, component), start, file.tell()
+
+    def rewrite(self, filepath, patch, outpath):
+        """Patch the .mu file at filepath into outpath without re-encoding it.
+
+        patch(event, data) is called for each event of stream() and returns
+        one of the MuRewrite actions. Only the sections it returns
+        MuRewrite.ENCODE for are written from data, everything else is
+        copied as the raw bytes it was read from, so untouched meshes,
+        animations and materials stay bit-exact. Lazy components must be
+        load()ed by patch before they can be modified. Components,
+        materials and textures can be removed with MuRewrite.DROP.
+
+        Files older than MuEnum.FILE_VERSION can't mix old and new
+        sections, so they are fully decoded and written in the current
+        format instead.
+
+        outpath is written (with replace_file) only when patch changed
+        something. Returns True if it did, False if not, and None if
+        filepath is not a .mu file.
+        """
+        if not self._open(filepath, True, True):
+            return None
+        upgrade = self.version != MuEnum.FILE_VERSION
+        if upgrade:
+            self.lazy = None
+        out = Mu(self.name)
+        out.file = BytesIO()
+        view = self.file.view
+        pos = self.file.tell()
+        if upgrade:
+            out.write_int(MuEnum.MODEL_BINARY)
+            out.write_int(MuEnum.FILE_VERSION)
+            out.write_string(self.name)
+        else:
+            out.write_bytes(view[:pos])
+        changed = False
+        try:
+            for event, data, start, end in self._sections():
+                action = patch(event, data) or MuRewrite.KEEP
+                if event not in rewrite_droppable and action == MuRewrite.DROP:
+                    action = MuRewrite.KEEP
+                if action == MuRewrite.KEEP and not upgrade:
+                    out.write_bytes(view[pos:end])
+                else:
+                    if not upgrade:
+                        # anything between the sections is kept
+                        out.write_bytes(view[pos:start])
+                    if action != MuRewrite.DROP:
+                        rewrite_encoders[event](out, data)
+                    changed |= action != MuRewrite.KEEP
+                pos = end
+            if not upgrade:
+                out.write_bytes(view[pos:])
+        finally:
+            self._close()
+        if changed:
+            replace_file(outpath, out.file.getvalue())
+        return changed
+
+    def _open(self, filepath, use_mmap, lazy):
+        if use_mmap:
+            self.file = MuMapFile(filepath)
+            self.read_struct = self.file.read_struct
+        else:
+            self.file = open(filepath, "rb")
+        self.lazy = None
+        self.magic, self.version = self.read_int(2)
+        if (self.magic != MuEnum.MODEL_BINARY or self.version < 0
+            or self.version > MuEnum.FILE_VERSION):
+            return False
+        if lazy:
+            # separate reader for the deferred components so they can still
+            # be loaded while this Mu is being written
+            self.lazy = Mu(self.name)
+            self.lazy.version = self.version
+            self.lazy.file = self.file
+            if use_mmap:
+                self.lazy.read_struct = self.file.read_struct
+        self.name = self.read_string()
+        return True
+    def _close(self):
+        self.__dict__.pop("read_struct", None)
         del self.file
+    def write(self, filepath):
+        """Write the model to filepath.
+
+        The model is serialized in memory and then saved with replace_file,
+        so a failed export never leaves a partial .mu behind.
+        """
+        self.file = BytesIO()
+        try:
+            self.write_int(MuEnum.MODEL_BINARY)
+            self.write_int(MuEnum.FILE_VERSION)
+            self.write_string(self.name)
+            self.obj.write(self)
+            if len(self.materials):
+                self.write_int(MuEnum.ET_MATERIALS)
+                self.write_int(len(self.materials))
+                for mat in self.materials:
+                    mat.write(self)
+            if len(self.textures):
+                self.write_int(MuEnum.ET_TEXTURES)
+                self.write_int(len(self.textures))
+                for tex in self.textures:
+                    tex.write(self)
+            with self.file.getbuffer() as data:
+                replace_file(filepath, data)
+        finally:
+            del self.file
+
+def replace_file(filepath, data):
+    """Atomically replace (or create) filepath with data.
+
+    data is written with a single write to a temporary file in the same
+    directory, which is then renamed over filepath. Readers (KSP, or another
+    export running at the same time) see either the old file or the new one,
+    never a partial file.
+    """
+    # through a symlink, the file it points to is replaced (not the link)
+    filepath = os.path.realpath(filepath)
+    dirname, basename = os.path.split(filepath)
+    try:
+        mode = os.stat(filepath).st_mode & 0o777
+    except FileNotFoundError:
+        mode = None
+    # created as open() would (0666 less the umask), unlike mkstemp's 0600
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    while True:
+        tmppath = os.path.join(dirname, "." + basename + "."
+                               + os.urandom(4).hex() + ".tmp")
+        try:
+            fd = os.open(tmppath, flags, 0o666)
+            break
+        except FileExistsError:
+            continue
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        if mode is not None:
+            # keep the replaced file's permissions
+            os.chmod(tmppath, mode)
+        os.replace(tmppath, filepath)
+    except BaseException:
+        os.unlink(tmppath)
+        raise
 
 if __name__ == "__main__":
     mu = Mu()
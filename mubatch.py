@@ -0,0 +1,161 @@
+# vim:ts=4:et
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Batch driver for the standalone .mu tools
+#   python lightfix.py [-j jobs] [--json results.json] path...
+# Each path may be a file, a glob or a directory (searched recursively for
+# the tool's file pattern). The tool's per-file function is run in a pool of
+# worker processes (mu.py doesn't need blender), its printed output is
+# collected per file so the output of different files is never mixed, and a
+# throughput summary is printed at the end.
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from fnmatch import fnmatch
+from io import StringIO
+from time import perf_counter
+import argparse
+import glob
+import json
+import os
+import sys
+
+class BatchResult:
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        self.result = None
+        self.error = None
+        self.output = ""
+        self.time = 0.0
+
+def find_files(paths, pattern="*.mu"):
+    files = []
+    seen = set()
+    for path in paths:
+        # a path that doesn't exist is kept so its error gets reported
+        for match in sorted(glob.glob(path, recursive=True)) or [path]:
+            if os.path.isdir(match):
+                found = []
+                for root, dirs, names in os.walk(match):
+                    for name in names:
+                        if fnmatch(name, pattern):
+                            found.append(os.path.join(root, name))
+                found.sort()
+            else:
+                found = [match]
+            for f in found:
+                if f not in seen:
+                    seen.add(f)
+                    files.append(f)
+    return files
+
+def run_file(func, path):
+    result = BatchResult(path)
+    output = StringIO()
+    start = perf_counter()
+    try:
+        result.size = os.path.getsize(path)
+        with redirect_stdout(output):
+            result.result = func(path)
+    except Exception as e:
+        result.error = "%s: %s" % (type(e).__name__, e)
+    result.time = perf_counter() - start
+    result.output = output.getvalue()
+    return result
+
+def run_batch(func, files, jobs=None):
+    """Run func(path) for each of files, yielding BatchResults as they
+    complete.
+
+    func must be picklable (a module level function). jobs is the number
+    of worker processes (default: one per cpu); 1 runs the files in this
+    process, in order.
+    """
+    if jobs == 1 or len(files) < 2:
+        for path in files:
+            yield run_file(func, path)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_file, func, path) for path in files]
+        for future in as_completed(futures):
+            yield future.result()
+
+def collect(batch):
+    # print each file's output as it completes
+    results = []
+    for result in batch:
+        sys.stdout.write(result.output)
+        if result.output and not result.output.endswith("\n"):
+            sys.stdout.write("\n")
+        if result.error is not None:
+            print("error: %s: %s" % (result.path, result.error))
+        results.append(result)
+    return results
+
+def summary(results, elapsed):
+    count = len(results)
+    errors = sum(1 for r in results if r.error is not None)
+    size = sum(r.size for r in results) / (1024 * 1024)
+    elapsed = max(elapsed, 1e-9)
+    return ("%d files (%d errors), %.1fMB in %.2fs: %.1f files/s, %.1fMB/s"
+            % (count, errors, size, elapsed, count / elapsed, size / elapsed))
+
+def write_json(results, filepath):
+    data = []
+    for r in results:
+        data.append({
+            "path": r.path,
+            "size": r.size,
+            "time": r.time,
+            "result": r.result,
+            "error": r.error,
+        })
+    with open(filepath, "wt") as f:
+        json.dump(data, f, indent=1, default=str)
+
+def parse_args(args, description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes (default: cpus)")
+    parser.add_argument("--json", metavar="FILE",
+                        help="write the per-file results to FILE")
+    parser.add_argument("paths", nargs="*",
+                        help="files, globs or directories to process")
+    return parser.parse_args(args)
+
+def batch_main(func, args=None, pattern="*.mu", description=None):
+    """Command line entry point for the tools: process the files named by
+    args (default sys.argv[1:]) with func and print each file's output,
+    any errors and the throughput summary. Returns the BatchResults in
+    file order.
+    """
+    if args is None:
+        args = sys.argv[1:]
+    args = parse_args(args, description)
+    files = find_files(args.paths, pattern)
+    order = {path: i for i, path in enumerate(files)}
+    start = perf_counter()
+    results = collect(run_batch(func, files, args.jobs))
+    elapsed = perf_counter() - start
+    results.sort(key=lambda r: order[r.path])
+    print(summary(results, elapsed))
+    if args.json:
+        write_json(results, args.json)
+    return results
@@ -0,0 +1,621 @@
+# vim:ts=4:et
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Micro-benchmarks for mu.py
+#   python mubench.py [count]
+# The primitive readers and writers are timed against the old way of doing
+# things (a format string built and parsed on every call, strings decoded a
+# character at a time) to show the per-call savings.
+#
+# Synthetic models (no KSP assets needed):
+#   python mubench.py generate DIR [--verts N] [--submeshes N] [--skinned N]
+#       [--curves N] [--keys N] [--particles N] [--colliders N] [--seed N]
+# writes one model of the given size to DIR, or with no size options, one
+# model for each of the corpus presets (small, medium, large, skinned,
+# animated).
+#
+# Codec throughput:
+#   python mubench.py codec [--repeat N] [path...]
+# times Mu.read, Mu.write and a read + write round trip on the files (the
+# corpus presets, generated in a temporary directory, if none are given),
+# reporting MB/s and verts/s. Each file is also read and written straight
+# back, and what is written must be byte for byte the original file (files
+# older than version 5 are upgraded on write, so will show as different).
+
+from io import BytesIO
+from struct import pack, unpack
+from time import perf_counter
+from timeit import timeit
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+from mu import Mu, MuEnum, MuKey, MuBoneWeight, MuObject, MuTransform
+from mu import MuTagLayer, MuMesh, MuRenderer, MuSkinnedMeshRenderer
+from mu import MuAnimation, MuClip, MuCurve, MuParticles, MuCollider
+from mu import MuColliderMesh, MuColliderCapsule, MuColliderBox
+from mu import MuMaterial, MuMatTex, MuTexture
+from mubatch import find_files
+
+class LegacyMu(Mu):
+    # the primitive codecs as they were before the Struct cache and the
+    # direct varint/string coding
+    def read_byte(self, count=1, force_list=False):
+        size = 1 * count
+        data = self.file.read(size)
+        if len(data) < size:
+            raise EOFError
+        data = unpack("<%dB" % count, data)
+        if count == 1 and not force_list:
+            return data[0]
+        return data
+
+    def read_int(self, count=1, force_list=False):
+        size = 4 * count
+        data = self.file.read(size)
+        if len(data) < size:
+            raise EOFError
+        data = unpack("<%di" % count, data)
+        if count == 1 and not force_list:
+            return data[0]
+        return data
+
+    def read_float(self, count=1, force_list=False):
+        size = 4 * count
+        data = self.file.read(size)
+        if len(data) < size:
+            raise EOFError
+        data = unpack("<%df" % count, data)
+        if count == 1 and not force_list:
+            return data[0]
+        return data
+
+    def read_vector(self):
+        v = self.read_float(3)
+        v = v[0], v[2], v[1]
+        return v
+
+    def read_quaternion(self):
+        q = self.read_float(4)
+        q = q[3], -q[0], -q[2], -q[1]
+        return q
+
+    def read_tangent(self):
+        t = self.read_float(4)
+        t = t[0], t[2], t[1], -t[3]
+        return t
+
+    def read_7int(self):
+        val = 0
+        mult = 1
+        while True:
+            valb = self.read_byte()
+            val += (valb & 127) * mult
+            if valb < 128:
+                break
+            mult *= 128
+        return val
+
+    def read_string(self):
+        size = self.read_7int()
+        data = self.file.read(size)
+        if len(data) < size:
+            raise EOFError
+        s = ""
+        for c in data:
+            s = s + chr(c)
+        return s
+
+    def write_byte(self, data):
+        if not hasattr(data, "__len__"):
+            data = (data,)
+        self.file.write(pack(("<%dB" % len(data)), *data))
+
+    def write_int(self, data):
+        if not hasattr(data, "__len__"):
+            data = (data,)
+        self.file.write(pack(("<%di" % len(data)), *data))
+
+    def write_7int(self, val):
+        while val > 127:
+            self.write_byte((val & 127) + 128)
+            val >>= 7
+        self.write_byte(val)
+
+    def write_string(self, data):
+        data = data.encode()
+        self.write_7int(len(data))
+        self.file.write(data)
+
+    def write_float(self, data):
+        if not hasattr(data, "__len__"):
+            data = (data,)
+        self.file.write(pack(("<%df" % len(data)), *data))
+
+    def write_vector(self, v):
+        v = v[0], v[2], v[1]
+        self.write_float(v)
+
+    def write_quaternion(self, q):
+        q = -q[1], -q[3], -q[2], q[0]
+        self.write_float(q)
+
+    def write_tangent(self, t):
+        t = t[0], t[2], t[1], -t[3]
+        self.write_float(t)
+
+def legacy_read_key(mu):
+    key = MuKey()
+    key.time = mu.read_float()
+    key.value = mu.read_float()
+    key.tangent = mu.read_float(2)
+    key.tangentMode = mu.read_int()
+    return key
+
+def legacy_write_key(mu, key):
+    mu.write_float(key.time)
+    mu.write_float(key.value)
+    mu.write_float(key.tangent)
+    mu.write_int(key.tangentMode)
+
+def legacy_read_bone_weight(mu):
+    bw = MuBoneWeight()
+    for i in range(4):
+        bw.indices.append(mu.read_int())
+        bw.weights.append(mu.read_float())
+    return bw
+
+def legacy_write_bone_weight(mu, bw):
+    for i in range(4):
+        mu.write_int(bw.indices[i])
+        mu.write_float(bw.weights[i])
+
+def make_key():
+    key = MuKey()
+    key.time, key.value, key.tangent, key.tangentMode = 0.5, 1.0, (0, 0), 0
+    return key
+
+def make_bone_weight():
+    bw = MuBoneWeight()
+    bw.indices = [0, 1, 2, 3]
+    bw.weights = [0.4, 0.3, 0.2, 0.1]
+    return bw
+
+# a typical transform or curve path
+name = "model/base/Center_Cylinder/coll torus"
+long_name = name * 4
+
+# name, encoded record, read function, write function
+primitives = [
+    ("int", bytes(4), lambda mu: mu.read_int(), lambda mu: mu.write_int(1)),
+    ("float", bytes(4), lambda mu: mu.read_float(),
+        lambda mu: mu.write_float(1.0)),
+    ("float2", bytes(8), lambda mu: mu.read_float(2),
+        lambda mu: mu.write_float((1.0, 2.0))),
+    ("vector", bytes(12), lambda mu: mu.read_vector(),
+        lambda mu: mu.write_vector((1.0, 2.0, 3.0))),
+    ("quaternion", bytes(16), lambda mu: mu.read_quaternion(),
+        lambda mu: mu.write_quaternion((1.0, 0.0, 0.0, 0.0))),
+    ("tangent", bytes(16), lambda mu: mu.read_tangent(),
+        lambda mu: mu.write_tangent((1.0, 0.0, 0.0, 1.0))),
+    ("7int", bytes((200, 1)), lambda mu: mu.read_7int(),
+        lambda mu: mu.write_7int(200)),
+    ("string", bytes((len(name),)) + name.encode(),
+        lambda mu: mu.read_string(), lambda mu: mu.write_string(name)),
+    ("string(long)", bytes((len(long_name) | 128, 1)) + long_name.encode(),
+        lambda mu: mu.read_string(), lambda mu: mu.write_string(long_name)),
+]
+
+def time_read(mu, record, func, count):
+    if type(record) is int:
+        record = bytes(record)
+    mu.file = BytesIO(record * count)
+    return timeit(lambda: func(mu), number=count) / count
+
+def time_write(mu, func, count):
+    mu.file = BytesIO()
+    return timeit(lambda: func(mu), number=count) / count
+
+def report(name, old, new):
+    print("%-22s %8.0fns %8.0fns %6.2fx"
+          % (name, old * 1e9, new * 1e9, old / new))
+
+def bench_primitives(count):
+    legacy = LegacyMu()
+    mu = Mu()
+    print("%-22s %10s %10s %7s" % ("", "legacy", "current", "speedup"))
+    for name, record, read, write in primitives:
+        report("read_" + name, time_read(legacy, record, read, count),
+                               time_read(mu, record, read, count))
+    read_key = lambda mu: MuKey().read(mu)
+    report("MuKey.read", time_read(legacy, 20, legacy_read_key, count),
+                         time_read(mu, 20, read_key, count))
+    read_bw = lambda mu: MuBoneWeight().read(mu)
+    report("MuBoneWeight.read",
+           time_read(legacy, 32, legacy_read_bone_weight, count),
+           time_read(mu, 32, read_bw, count))
+    for name, record, read, write in primitives:
+        report("write_" + name, time_write(legacy, write, count),
+                                time_write(mu, write, count))
+    key = make_key()
+    report("MuKey.write",
+           time_write(legacy, lambda mu: legacy_write_key(mu, key), count),
+           time_write(mu, lambda mu: key.write(mu), count))
+    bw = make_bone_weight()
+    report("MuBoneWeight.write",
+           time_write(legacy, lambda mu: legacy_write_bone_weight(mu, bw),
+                      count),
+           time_write(mu, lambda mu: bw.write(mu), count))
+
+class ModelSize:
+    def __init__(self, verts=1000, submeshes=1, skinned=0, curves=0, keys=0,
+                 particles=0, colliders=0):
+        self.verts = verts          # per mesh
+        self.submeshes = submeshes  # per mesh
+        self.skinned = skinned      # skinned mesh renderers
+        self.curves = curves        # animation curves (one clip)
+        self.keys = keys            # per curve
+        self.particles = particles  # particle emitters
+        self.colliders = colliders  # cycles through mesh, sphere, capsule, box
+
+corpus_presets = {
+    "small": ModelSize(verts=200, colliders=1),
+    "medium": ModelSize(verts=5000, submeshes=2, colliders=2, particles=1),
+    "large": ModelSize(verts=60000, submeshes=4, colliders=4),
+    "skinned": ModelSize(verts=8000, skinned=4, curves=30, keys=60),
+    "animated": ModelSize(verts=1000, curves=200, keys=250, particles=2),
+}
+
+collider_types = [
+    MuEnum.ET_MESH_COLLIDER2,
+    MuEnum.ET_SPHERE_COLLIDER2,
+    MuEnum.ET_CAPSULE_COLLIDER2,
+    MuEnum.ET_BOX_COLLIDER2,
+]
+
+def rand_vector(rand, size=1.0):
+    return tuple(rand.uniform(-size, size) for i in range(3))
+
+def make_object(rand, name):
+    obj = MuObject(name)
+    obj.transform = MuTransform()
+    obj.transform.name = name
+    obj.transform.localPosition = rand_vector(rand)
+    obj.transform.localRotation = (1.0, 0.0, 0.0, 0.0)
+    obj.transform.localScale = (1.0, 1.0, 1.0)
+    obj.tag_and_layer = MuTagLayer()
+    obj.tag_and_layer.tag = "Untagged"
+    obj.tag_and_layer.layer = 0
+    return obj
+
+def make_mesh(rand, verts, submeshes=1, bones=0):
+    # a grid of quads so the triangles share vertices the way real meshes do
+    # (the vertex count is rounded to a whole number of rows)
+    width = max(2, int(verts ** 0.5))
+    rows = max(2, verts // width)
+    mesh = MuMesh()
+    mesh.verts = [(x * 0.1, y * 0.1, rand.uniform(-0.01, 0.01))
+                  for y in range(rows) for x in range(width)]
+    mesh.uvs = [(x / (width - 1), y / (rows - 1))
+                for y in range(rows) for x in range(width)]
+    mesh.normals = [(0.0, 0.0, 1.0)] * len(mesh.verts)
+    mesh.tangents = [(1.0, 0.0, 0.0, 1.0)] * len(mesh.verts)
+    mesh.colors = [(1.0, 1.0, 1.0, 1.0)] * len(mesh.verts)
+    tris = []
+    for y in range(rows - 1):
+        for x in range(width - 1):
+            v = y * width + x
+            tris.append((v, v + 1, v + width + 1))
+            tris.append((v, v + width + 1, v + width))
+    # the quad rows are dealt out to the submeshes in bands
+    band = len(tris) // submeshes + 1
+    mesh.submeshes = [tris[i * band:(i + 1) * band] for i in range(submeshes)]
+    if bones:
+        bone_weights = []
+        for v in mesh.verts:
+            bw = MuBoneWeight()
+            bw.indices = rand.sample(range(bones), min(4, bones))
+            bw.indices += [0] * (4 - len(bw.indices))
+            weights = [rand.random() for i in range(4)]
+            total = sum(weights)
+            bw.weights = [w / total for w in weights]
+            bone_weights.append(bw)
+        mesh.boneWeights = bone_weights
+        mesh.bindPoses = [(1.0, 0.0, 0.0, 0.0,
+                           0.0, 1.0, 0.0, 0.0,
+                           0.0, 0.0, 1.0, 0.0,
+                           0.0, 0.0, 0.0, 1.0)] * bones
+    return mesh
+
+def make_renderer():
+    renderer = MuRenderer()
+    renderer.materials = [0]
+    return renderer
+
+def make_skin(rand, parent, index, size):
+    bones = ["%s_bone%d" % (parent.transform.name, i) for i in range(4)]
+    for name in bones:
+        parent.children.append(make_object(rand, name))
+    obj = make_object(rand, "skin%d" % index)
+    smr = MuSkinnedMeshRenderer()
+    smr.materials = [0]
+    smr.center = (0.0, 0.0, 0.0)
+    smr.size = (1.0, 1.0, 1.0)
+    smr.quality = 0
+    smr.updateWhenOffscreen = 0
+    smr.bones = bones
+    smr.mesh = make_mesh(rand, size.verts, size.submeshes, len(bones))
+    obj.skinned_mesh_renderer = smr
+    return obj
+
+def make_animation(rand, paths, size):
+    properties = ["m_LocalPosition.x", "m_LocalPosition.y",
+                  "m_LocalPosition.z", "m_LocalRotation.w",
+                  "m_LocalRotation.x", "m_LocalRotation.y",
+                  "m_LocalRotation.z"]
+    clip = MuClip()
+    clip.name = "clip"
+    clip.lbCenter = (0.0, 0.0, 0.0)
+    clip.lbSize = (1.0, 1.0, 1.0)
+    clip.wrapMode = 0
+    for i in range(size.curves):
+        curve = MuCurve()
+        curve.path = paths[i % len(paths)]
+        curve.property = properties[i % len(properties)]
+        curve.type = 0
+        curve.wrapMode = (8, 8)
+        curve.keys = []
+        for k in range(size.keys):
+            key = MuKey()
+            key.time = k / 30
+            key.value = rand.uniform(-1, 1)
+            key.tangent = (0.0, 0.0)
+            key.tangentMode = 0
+            curve.keys.append(key)
+        clip.curves.append(curve)
+    anim = MuAnimation()
+    anim.clips = [clip]
+    anim.clip = clip.name
+    anim.autoPlay = 1
+    return anim
+
+def make_particles(rand):
+    p = MuParticles()
+    p.emit = 1
+    p.shape = 0
+    p.shape3d = (0.0, 0.0, 0.0)
+    p.shape2d = (0.0, 0.0)
+    p.shape1d = 0.0
+    p.color = (1.0, 1.0, 1.0, 1.0)
+    p.useUorldSpace = 0
+    p.size = (0.1, 0.5)
+    p.energy = (1.0, 2.0)
+    p.emission = (10, 20)
+    p.worldVelocity = (0.0, 0.0, 0.0)
+    p.localVelocity = rand_vector(rand)
+    p.rndVelocity = (0.1, 0.1, 0.1)
+    p.emitterVelocityScale = 0.0
+    p.angularVelocity = 0.0
+    p.rndAngularVelocity = 0.0
+    p.rndRotation = 0
+    p.doesAnimateColor = 1
+    p.colorAnimation = [(1.0, 1.0, 1.0, 1.0 - i / 4) for i in range(5)]
+    p.worldRotationAxis = (0.0, 0.0, 0.0)
+    p.localRotationAxis = (0.0, 0.0, 0.0)
+    p.sizeGrow = 0.0
+    p.rndForce = (0.0, 0.0, 0.0)
+    p.force = (0.0, 0.0, 0.0)
+    p.damping = 1.0
+    p.castShadows = 0
+    p.recieveShadows = 0
+    p.lengthScale = 2.0
+    p.velocityScale = 0.0
+    p.maxParticleSize = 0.25
+    p.particleRenderMode = 0
+    p.uvAnimation = (1, 1, 1)
+    p.count = 0
+    return p
+
+def make_collider(rand, index, size):
+    collider = MuCollider(collider_types[index % len(collider_types)])
+    collider.isTrigger = 0
+    if isinstance(collider, MuColliderMesh):
+        collider.convex = 1
+        collider.mesh = make_mesh(rand, max(size.verts // 10, 4))
+    elif isinstance(collider, MuColliderBox):
+        collider.size = (1.0, 1.0, 1.0)
+        collider.center = rand_vector(rand)
+    else:
+        collider.radius = 0.5
+        collider.center = rand_vector(rand)
+        if isinstance(collider, MuColliderCapsule):
+            collider.height = 2.0
+            collider.direction = 1
+    return collider
+
+def make_model(size, seed=0, name="synthetic"):
+    """Build a synthetic Mu of the given ModelSize.
+
+    The model has a root with a mesh, plus one child object per skinned
+    mesh, particle emitter and collider. The animation (if any) is on the
+    root and its curves cycle through the paths of the children.
+    """
+    rand = random.Random(seed)
+    mu = Mu(name)
+    mu.obj = root = make_object(rand, name)
+    root.shared_mesh = make_mesh(rand, size.verts, size.submeshes)
+    root.renderer = make_renderer()
+    paths = [""]
+    for i in range(size.skinned):
+        root.children.append(make_skin(rand, root, i, size))
+    for i in range(size.particles):
+        obj = make_object(rand, "particles%d" % i)
+        obj.particles = make_particles(rand)
+        root.children.append(obj)
+    for i in range(size.colliders):
+        obj = make_object(rand, "collider%d" % i)
+        obj.collider = make_collider(rand, i, size)
+        root.children.append(obj)
+    paths += [child.transform.name for child in root.children]
+    if size.curves:
+        root.animation = make_animation(rand, paths, size)
+    mat = MuMaterial()
+    mat.name = "material"
+    mat.shaderName = "KSP/Diffuse"
+    mat.colorProperties["_Color"] = (1.0, 1.0, 1.0, 1.0)
+    tex = MuMatTex()
+    tex.index = 0
+    tex.scale = (1.0, 1.0)
+    tex.offset = (0.0, 0.0)
+    mat.textureProperties["_MainTex"] = tex
+    mu.materials = [mat]
+    tex = MuTexture()
+    tex.name = "texture"
+    tex.type = 0
+    mu.textures = [tex]
+    return mu
+
+def write_corpus(directory, sizes, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    for name, size in sizes.items():
+        filepath = os.path.join(directory, name + ".mu")
+        make_model(size, seed, name).write(filepath)
+        files.append(filepath)
+    return files
+
+def count_verts(obj):
+    verts = 0
+    for mesh in [getattr(obj, "shared_mesh", None),
+                 getattr(getattr(obj, "skinned_mesh_renderer", None),
+                         "mesh", None),
+                 getattr(getattr(obj, "collider", None), "mesh", None)]:
+        if mesh is not None:
+            verts += len(mesh.verts)
+    return verts + sum(count_verts(child) for child in obj.children)
+
+def best_time(func, repeat):
+    best = None
+    for i in range(repeat):
+        start = perf_counter()
+        result = func()
+        elapsed = perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def check_round_trip(filepath, tmpdir):
+    # the file read and written straight back must be the original file
+    outpath = os.path.join(tmpdir, "round_trip.mu")
+    Mu().read(filepath).write(outpath)
+    with open(filepath, "rb") as f:
+        original = f.read()
+    with open(outpath, "rb") as f:
+        written = f.read()
+    return original == written
+
+def bench_codec_file(filepath, repeat, tmpdir):
+    outpath = os.path.join(tmpdir, "out.mu")
+    size = os.path.getsize(filepath)
+    read, mu = best_time(lambda: Mu().read(filepath), repeat)
+    if not mu:
+        raise ValueError("not a .mu file")
+    verts = count_verts(mu.obj)
+    write = best_time(lambda: mu.write(outpath), repeat)[0]
+    round_trip = best_time(lambda: Mu().read(filepath).write(outpath),
+                           repeat)[0]
+    return size, verts, read, write, round_trip, check_round_trip(filepath,
+                                                                 tmpdir)
+
+def bench_codec(files, repeat):
+    mb = 1024 * 1024
+    failures = 0
+    print("%-24s %8s %9s %22s %22s %22s %s"
+          % ("", "MB", "verts", "read MB/s  verts/s", "write MB/s  verts/s",
+             "round trip MB/s", "bytes"))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for filepath in files:
+            name = os.path.basename(filepath)
+            try:
+                (size, verts, read, write, round_trip,
+                 same) = bench_codec_file(filepath, repeat, tmpdir)
+            except Exception as e:
+                print("%-24s %s: %s" % (name, type(e).__name__, e))
+                failures += 1
+                continue
+            if not same:
+                failures += 1
+            print("%-24s %8.2f %9d %9.1f %12.0f %9.1f %12.0f %12.1f %12s"
+                  % (name, size / mb, verts,
+                     size / mb / read, verts / read,
+                     size / mb / write, verts / write,
+                     size / mb / round_trip,
+                     "equal" if same else "DIFFERENT"))
+    return failures
+
+def size_args(parser):
+    defaults = ModelSize()
+    for name in ["verts", "submeshes", "skinned", "curves", "keys",
+                 "particles", "colliders"]:
+        parser.add_argument("--" + name, type=int, default=None,
+                            help="default %d" % getattr(defaults, name))
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="benchmark mu.py")
+    sub = parser.add_subparsers(dest="command")
+    gen = sub.add_parser("generate", help="write synthetic .mu models")
+    gen.add_argument("directory")
+    gen.add_argument("--name", default="synthetic")
+    gen.add_argument("--seed", type=int, default=0)
+    size_args(gen)
+    codec = sub.add_parser("codec", help="read/write/round trip throughput")
+    codec.add_argument("--repeat", type=int, default=3)
+    codec.add_argument("paths", nargs="*")
+    return parser.parse_args(args)
+
+def main(args):
+    if not args or args[0].isdigit():
+        count = int(args[0]) if args else 100000
+        bench_primitives(count)
+        return 0
+    args = parse_args(args)
+    if args.command == "generate":
+        size = ModelSize()
+        options = {}
+        for name in size.__dict__:
+            if getattr(args, name) is not None:
+                options[name] = getattr(args, name)
+        if options:
+            size.__dict__.update(options)
+            sizes = {args.name: size}
+        else:
+            sizes = corpus_presets
+        for filepath in write_corpus(args.directory, sizes, args.seed):
+            print(filepath, os.path.getsize(filepath))
+        return 0
+    if args.paths:
+        return 1 if bench_codec(find_files(args.paths), args.repeat) else 0
+    with tempfile.TemporaryDirectory() as corpus:
+        files = write_corpus(corpus, corpus_presets)
+        return 1 if bench_codec(files, args.repeat) else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -17,7 +17,21 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
-from struct import pack, unpack
+from struct import Struct
+
+# Struct objects keyed by type code and count, so each format is parsed only
+# once (see mu.py)
+struct_cache = {}
+
+def get_struct(code, count):
+    try:
+        return struct_cache[code, count]
+    except KeyError:
+        s = struct_cache[code, count] = Struct("<%d%s" % (count, code))
+        return s
+
+VECTOR = get_struct("f", 3)
+QUATERNION = get_struct("f", 4)
 
 class BinaryReader:
     def __init__(self, file):
@@ -27,21 +41,21 @@ class BinaryReader:
         self.file.close()
 
     def read_byte(self, count=1, force_list=False):
-        size = 1 * count
-        data = self.file.read(size)
-        if len(data) < size:
+        st = get_struct("B", count)
+        data = self.file.read(st.size)
+        if len(data) < st.size:
             raise EOFError
-        data = unpack("<%dB" % count, data)
+        data = st.unpack(data)
         if count == 1 and not force_list:
             return data[0]
         return data
 
     def read_int(self, count=1, force_list=False):
-        size = 4 * count
-        data = self.file.read(size)
-        if len(data) < size:
+        st = get_struct("i", count)
+        data = self.file.read(st.size)
+        if len(data) < st.size:
             raise EOFError
-        data = unpack("<%di" % count, data)
+        data = st.unpack(data)
         if count == 1 and not force_list:
             return data[0]
         return data
@@ -65,43 +79,49 @@ class BinaryReader:
         return vals
 
     def read_uint(self, count=1, force_list=False):
-        size = 4 * count
-        data = self.file.read(size)
-        if len(data) < size:
+        st = get_struct("I", count)
+        data = self.file.read(st.size)
+        if len(data) < st.size:
             raise EOFError
-        data = unpack("<%dI" % count, data)
+        data = st.unpack(data)
         if count == 1 and not force_list:
             return data[0]
         return data
 
     def read_float(self, count=1, force_list=False):
-        size = 4 * count
-        data = self.file.read(size)
-        if len(data) < size:
+        st = get_struct("f", count)
+        data = self.file.read(st.size)
+        if len(data) < st.size:
             raise EOFError
-        data = unpack("<%df" % count, data)
+        data = st.unpack(data)
         if count == 1 and not force_list:
             return data[0]
         return data
 
     def read_vector(self):
-        v = self.read_float(3)
+        data = self.file.read(12)
+        if len(data) < 12:
+            raise EOFError
+        x, y, z = VECTOR.unpack(data)
         #convert from Unity's LHS to Blender's RHS
-        v = v[0], v[2], v[1]
-        return v
+        return x, z, y
 
     def read_quaternion(self):
-        q = self.read_float(4)
+        data = self.file.read(16)
+        if len(data) < 16:
+            raise EOFError
+        x, y, z, w = QUATERNION.unpack(data)
         # Unity is xyzw, blender is wxyz. However, Unity is left-handed and
         # blender is right handed. To convert between LH and RH (either
         # direction), just swap y and z and reverse the rotation direction.
-        q = q[3], -q[0], -q[2], -q[1]
-        return q
+        return w, -x, -z, -y
 
     def read_tangent(self):
-        t = self.read_float(4)
-        t = t[0], t[2], t[1], -t[3]
-        return t
+        data = self.file.read(16)
+        if len(data) < 16:
+            raise EOFError
+        x, y, z, w = QUATERNION.unpack(data)
+        return x, z, y, -w
 
     def read_bytes(self, size):
         data = self.file.read(size)
@@ -119,12 +139,12 @@ class BinaryWriter:
     def write_byte(self, data):
         if not hasattr(data, "__len__"):
             data = (data,)
-        self.file.write(pack(("<%dB" % len(data)), *data))
+        self.file.write(get_struct("B", len(data)).pack(*data))
 
     def write_int(self, data):
         if not hasattr(data, "__len__"):
             data = (data,)
-        self.file.write(pack(("<%di" % len(data)), *data))
+        self.file.write(get_struct("i", len(data)).pack(*data))
 
     def write_7int(self, data):
         def writeval(val):
@@ -143,28 +163,25 @@ class BinaryWriter:
     def write_uint(self, data):
         if not hasattr(data, "__len__"):
             data = (data,)
-        self.file.write(pack(("<%dI" % len(data)), *data))
+        self.file.write(get_struct("I", len(data)).pack(*data))
 
     def write_float(self, data):
         if not hasattr(data, "__len__"):
             data = (data,)
-        self.file.write(pack(("<%df" % len(data)), *data))
+        self.file.write(get_struct("f", len(data)).pack(*data))
 
     def write_vector(self, v):
         #convert from Blender's RHS to Unity's LHS
-        v = v[0], v[2], v[1]
-        self.write_float(v)
+        self.file.write(VECTOR.pack(v[0], v[2], v[1]))
 
     def write_quaternion(self, q):
         # Unity is xyzw, blender is wxyz. However, Unity is left-handed and
         # blender is right handed. To convert between LH and RH (either
         # direction), just swap y and z and reverse the rotation direction.
-        q = -q[1], -q[3], -q[2], q[0]
-        self.write_float(q)
+        self.file.write(QUATERNION.pack(-q[1], -q[3], -q[2], q[0]))
 
     def write_tangent(self, t):
-        t = t[0], t[2], t[1], -t[3]
-        self.write_float(t)
+        self.file.write(QUATERNION.pack(t[0], t[2], t[1], -t[3]))
 
     def write_color(self, c):
         cb = tuple(map(lambda x: int(bound(0, x, 1) * 255), c))